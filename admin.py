@@ -2,9 +2,27 @@ from flask_admin import Admin, AdminIndexView, expose
 from flask_admin.contrib.sqla import ModelView
 from flask_admin.theme import Bootstrap4Theme
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from flask import request, redirect, url_for, render_template_string, Blueprint
+from flask import request, redirect, url_for, render_template_string, Blueprint, g, flash, jsonify
+from sqlalchemy import text
 import os
-from database import db, CenterPoint, ArchaeologicalSite, QuizQuestion
+from database import db, CenterPoint, ArchaeologicalSite, QuizQuestion, QuizAnswer, QuizQuestionStat, Territory
+from export import available_formats, export_response
+
+# 行数低于该值时直接 COUNT(*)，更大的表在 Postgres 上使用 pg_class.reltuples 估算
+EXACT_COUNT_LIMIT = 10000
+
+
+def approximate_count(model):
+    """返回表的行数；Postgres 大表使用统计信息中的估算值，避免全表 COUNT(*)"""
+    if db.engine.dialect.name == 'postgresql':
+        estimate = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+            {'name': model.__tablename__}
+        ).scalar()
+        # 从未 ANALYZE 的表 reltuples 为 -1 或 0，此时回退到精确计数
+        if estimate is not None and estimate >= EXACT_COUNT_LIMIT:
+            return int(estimate)
+    return db.session.query(db.func.count(model.id)).scalar()
 
 # 初始化登录管理器
 login_manager = LoginManager()
@@ -22,19 +40,144 @@ def load_user(user_id):
 
 
 # 1. 优化模型视图：添加搜索和过滤功能，使其更具"功能性"
+def is_admin():
+    return current_user.is_authenticated
+
+
 class SecureModelView(ModelView):
     def is_accessible(self):
-        return current_user.is_authenticated
+        return is_admin()
 
     def inaccessible_callback(self, name, **kwargs):
         return redirect(url_for('admin_auth.login', next=request.url))
 
     # 开启显示条目数自定义
     page_size = 20
-    can_export = True  # 允许导出数据
+    # 内置导出会把结果整批读入内存，改用下面的流式导出
+    can_export = False
+    list_template = 'admin/model/secure_list.html'
+
+    def stream_export_formats(self):
+        return available_formats()
+
+    @expose('/stream-export/<fmt>/')
+    def stream_export_view(self, fmt):
+        """流式导出整表（CSV / XLSX），内存占用不随表大小增长"""
+        response = export_response(self.model, fmt)
+        if response is None:
+            flash(f'不支持的导出格式: {fmt}', 'error')
+            return redirect(self.get_url('.index_view'))
+        return response
+
+
+# 2. 大表列表视图：按 id 做 keyset（seek）分页，避免深翻页时的 OFFSET 扫描
+class KeysetModelView(SecureModelView):
+    """未指定排序时按主键 id 翻页：下一页 ?after=<本页最后 id>，上一页 ?before=<本页首个 id>
+
+    用户点击其他列排序时回退到 Flask-Admin 默认的 OFFSET 分页。
+    无搜索/过滤条件时总数使用 approximate_count()，有条件时不再计算总数。
+    """
+    list_template = 'admin/model/keyset_list.html'
+
+    def _get_list_extra_args(self):
+        view_args = super()._get_list_extra_args()
+        # 游标参数不放进 extra_args，否则排序、过滤等链接会带上旧游标
+        g.keyset_after = view_args.extra_args.pop('after', None)
+        g.keyset_before = view_args.extra_args.pop('before', None)
+        g.keyset_view_args = view_args
+        return view_args
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        if sort_column is not None or not execute:
+            g.keyset_active = False
+            return super().get_list(page, sort_column, sort_desc, search, filters,
+                                    execute=execute, page_size=page_size)
+
+        g.keyset_active = True
+        page_size = page_size or self.page_size
+        pk = self.model.id
+
+        query = self.get_query()
+        joins, count_joins = {}, {}
+        if self._search_supported and search:
+            query, _, joins, count_joins = self._apply_search(query, None, joins, count_joins, search)
+        if filters and self._filters:
+            query, _, joins, count_joins = self._apply_filters(query, None, joins, count_joins, filters)
+
+        count = approximate_count(self.model) if not (search or filters) else None
+
+        after = request.args.get('after', type=int)
+        before = request.args.get('before', type=int)
+        if before is not None:
+            # 向前翻页：倒序取 page_size + 1 条再翻转
+            rows = query.filter(pk < before).order_by(pk.desc()).limit(page_size + 1).all()
+            has_prev = len(rows) > page_size
+            rows = list(reversed(rows[:page_size]))
+            has_next = True
+        else:
+            if after is not None:
+                query = query.filter(pk > after)
+            rows = query.order_by(pk.asc()).limit(page_size + 1).all()
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
+            has_prev = after is not None
+
+        g.keyset_first_id = rows[0].id if rows else None
+        g.keyset_last_id = rows[-1].id if rows else None
+        g.keyset_has_prev = has_prev and bool(rows)
+        g.keyset_has_next = has_next and bool(rows)
+        return count, rows
+
+    def _keyset_url(self, **cursor):
+        view_args = g.keyset_view_args.clone(page=None)
+        view_args.extra_args.update(cursor)
+        return self._get_list_url(view_args)
+
+    def render(self, template, **kwargs):
+        if template == self.list_template and g.get('keyset_active'):
+            kwargs['keyset_prev_url'] = (
+                self._keyset_url(before=g.keyset_first_id) if g.keyset_has_prev else None
+            )
+            kwargs['keyset_next_url'] = (
+                self._keyset_url(after=g.keyset_last_id) if g.keyset_has_next else None
+            )
+        return super().render(template, **kwargs)
+
+
+# 搜索与过滤需声明为类属性：Flask-Admin 在构造视图时据此生成过滤器与搜索条件
+class SiteView(KeysetModelView):
+    column_searchable_list = ['name', 'location']
+    column_filters = ['year']
+
 
+class QuizView(KeysetModelView):
+    column_searchable_list = ['question', 'visual']
+    column_filters = ['answer']
 
-# 2. 优化首页视图：注入统计数据
+
+# 3. 疆域视图：几何数据由导入脚本生成，表单中不展示
+class TerritoryView(SecureModelView):
+    form_excluded_columns = ['shapes']
+    column_exclude_list = ['description']
+
+
+# 4. 作答统计视图：由 analytics.py rollup 生成，只读
+class QuizStatView(SecureModelView):
+    can_create = False
+    can_edit = False
+    can_delete = False
+    column_list = ['question', 'attempts', 'difficulty', 'correct_count',
+                   'option1_count', 'option2_count', 'option3_count', 'option4_count',
+                   'top_distractor', 'avg_elapsed_ms', 'updated_at']
+    column_default_sort = ('difficulty', True)
+    column_formatters = {
+        'question': lambda v, c, m, p: m.question.question[:40] if m.question else m.question_id,
+        'difficulty': lambda v, c, m, p: f'{m.difficulty:.0%}',
+        'top_distractor': lambda v, c, m, p: '' if m.top_distractor is None else f'选项 {m.top_distractor + 1}',
+    }
+
+
+# 5. 优化首页视图：注入统计数据
 class SecureAdminIndexView(AdminIndexView):
     @expose('/')
     def index(self):
@@ -42,15 +185,20 @@ class SecureAdminIndexView(AdminIndexView):
             return redirect(url_for('admin_auth.login', next=request.url))
 
         # 获取统计数据
-        site_count = ArchaeologicalSite.query.count()
-        center_count = CenterPoint.query.count()
-        quiz_count = QuizQuestion.query.count()
+        site_count = approximate_count(ArchaeologicalSite)
+        center_count = approximate_count(CenterPoint)
+        quiz_count = approximate_count(QuizQuestion)
+        answer_count = approximate_count(QuizAnswer)
+        hardest = QuizQuestionStat.query.filter(QuizQuestionStat.attempts >= 10) \
+            .order_by(QuizQuestionStat.difficulty.desc()).limit(5).all()
 
         # 渲染自定义的 dashboard 模板，并传入 quiz_count
         return self.render('admin/index.html',
                            site_count=site_count,
                            center_count=center_count,
-                           quiz_count=quiz_count)
+                           quiz_count=quiz_count,
+                           answer_count=answer_count,
+                           hardest=hardest)
 
 
 # 创建认证蓝图
@@ -95,6 +243,45 @@ def login():
     ''')
 
 
+# 只接受 JSON Lines 类型：跨站表单无法伪造该 Content-Type，避免借登录态发起 CSRF
+BULK_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+
+
+@admin_bp.route('/api/bulk', methods=['POST'])
+def bulk_api():
+    """批量增删改遗址、中心点、题库（JSON Lines，每行一个操作）"""
+    from bulk import BulkError, apply_operations, parse_and_validate
+
+    if not is_admin():
+        return jsonify({"error": "Unauthorized"}), 401
+    if request.mimetype not in BULK_CONTENT_TYPES:
+        return jsonify({"error": f"Content-Type 必须为 {BULK_CONTENT_TYPES[0]}"}), 415
+
+    try:
+        operations, errors = parse_and_validate(request.get_data(as_text=True).splitlines())
+    except BulkError as e:
+        return jsonify({"error": str(e)}), 413
+    if errors:
+        # 有任何一行校验失败则整批不写入，修正后重新提交
+        return jsonify({"applied": False, "results": errors}), 422
+
+    results, map_touched = apply_operations(operations)
+    if map_touched:
+        from snapshot import write_map_snapshot
+        try:
+            write_map_snapshot()
+        except Exception as e:
+            print(f"地图快照重建失败: {e}")
+
+    failed = sum(1 for r in results if r['status'] == 'error')
+    return jsonify({
+        "applied": True,
+        "total": len(results),
+        "failed": failed,
+        "results": results
+    })
+
+
 @admin_bp.route('/logout')
 @login_required
 def logout():
@@ -116,13 +303,7 @@ def init_admin(app):
     )
 
     # 注册视图
-    site_view = SecureModelView(ArchaeologicalSite, db.session, name='遗址列表', category='地图数据', endpoint='site_admin')
-    try:
-        site_view.column_searchable_list = ['name', 'location']
-        site_view.column_filters = ['year']
-    except:
-        pass
-    admin.add_view(site_view)
+    admin.add_view(SiteView(ArchaeologicalSite, db.session, name='遗址列表', category='地图数据', endpoint='site_admin'))
 
     # 中心点管理
     admin.add_view(SecureModelView(
@@ -133,11 +314,17 @@ def init_admin(app):
         endpoint='center_admin'
     ))
 
+    # 疆域管理（几何由 migrate.py territory 导入，这里只维护名称与年代）
+    admin.add_view(TerritoryView(
+        Territory,
+        db.session,
+        name='疆域年代',
+        category='地图数据',
+        endpoint='territory_admin'
+    ))
+
     # 题库管理
-    quiz_view = SecureModelView(QuizQuestion, db.session, name='题库管理', category='互动游戏', endpoint='quiz_admin')
-    try:
-        quiz_view.column_searchable_list = ['question', 'visual']
-        quiz_view.column_filters = ['answer']
-    except:
-        pass
-    admin.add_view(quiz_view)
\ No newline at end of file
+    admin.add_view(QuizView(QuizQuestion, db.session, name='题库管理', category='互动游戏', endpoint='quiz_admin'))
+
+    # 作答统计
+    admin.add_view(QuizStatView(QuizQuestionStat, db.session, name='作答统计', category='互动游戏', endpoint='quiz_stat_admin'))
\ No newline at end of file
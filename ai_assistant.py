@@ -1,7 +1,9 @@
 import os
+import uuid
 import streamlit as st
 from dotenv import load_dotenv
 from zai import ZhipuAiClient
+from ratelimit import LocalRateLimiter
 
 # 页面基础配置（第一步先设置页面风格）
 st.set_page_config(
@@ -123,6 +125,15 @@ client = ZhipuAiClient(
 )
 
 
+@st.cache_resource
+def get_rate_limiter():
+    """跨页面重跑保留的限流器：单个会话与全站各有一份预算，保护 API 额度"""
+    return LocalRateLimiter({
+        'session': os.getenv('ASSISTANT_SESSION_LIMIT', '5/minute'),
+        'global': os.getenv('ASSISTANT_GLOBAL_LIMIT', '60/minute'),
+    })
+
+
 def query_knowledge_base(question):
     """
     使用智谱AI知识库进行问答（修复检索逻辑+优化错误处理）
@@ -224,6 +235,10 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
 
+# 每个浏览器会话一个限流标识
+if "client_id" not in st.session_state:
+    st.session_state.client_id = uuid.uuid4().hex
+
 # 初始化聊天记录
 if "messages" not in st.session_state:
     st.session_state.messages = [
@@ -251,23 +266,31 @@ if prompt := st.chat_input("请输入关于楚文化的问题，探寻荆楚文
         st.write(prompt)
 
     # 调用知识库问答并显示结果
+    limiter = get_rate_limiter()
+    allowed, retry_after = limiter.hit('session', st.session_state.client_id)
+    if allowed:
+        allowed, retry_after = limiter.hit('global', 'all')
     with st.chat_message("assistant"):
-        with st.spinner("🕯️ 正在检索楚简帛书，梳理荆楚文脉..."):
-            answer, citations = query_knowledge_base(prompt)
+        if not allowed:
+            answer, citations = f"提问过于频繁，请 {retry_after} 秒后再试。", []
             st.write(answer)
+        else:
+            with st.spinner("🕯️ 正在检索楚简帛书，梳理荆楚文脉..."):
+                answer, citations = query_knowledge_base(prompt)
+                st.write(answer)
 
-            # 显示检索到的参考内容（验证是否真的调用了知识库）
-            if citations:
-                with st.expander("📜 出土文献参考", expanded=False):
-                    st.markdown("### 🔍 知识库引证内容：")
-                    for idx, cite in enumerate(citations, 1):
-                        # 提取引用内容（兼容zai库的返回格式）
-                        cite_content = getattr(cite, 'content', '无')
-                        st.markdown(f"""
-                        <div style="padding: 8px; margin: 5px 0; border-left: 3px solid var(--chu-gold);">
-                            <strong>参考{idx}：</strong> {cite_content[:300]}...
-                        </div>
-                        """, unsafe_allow_html=True)
+                # 显示检索到的参考内容（验证是否真的调用了知识库）
+                if citations:
+                    with st.expander("📜 出土文献参考", expanded=False):
+                        st.markdown("### 🔍 知识库引证内容：")
+                        for idx, cite in enumerate(citations, 1):
+                            # 提取引用内容（兼容zai库的返回格式）
+                            cite_content = getattr(cite, 'content', '无')
+                            st.markdown(f"""
+                            <div style="padding: 8px; margin: 5px 0; border-left: 3px solid var(--chu-gold);">
+                                <strong>参考{idx}：</strong> {cite_content[:300]}...
+                            </div>
+                            """, unsafe_allow_html=True)
 
     # 保存AI回答
     st.session_state.messages.append({"role": "assistant", "content": answer})
\ No newline at end of file
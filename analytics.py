@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+答题数据采集与汇总
+
+采集（写后批量）：
+    POST /api/quiz-answers 只做校验并放入内存缓冲，同时追加到本地 spool 文件后立即返回 202；
+    后台线程每隔几秒（或缓冲达到一批）用一条批量 INSERT 写入 quiz_answers。
+    worker 被重启时，spool 中尚未入库的事件会在下一个 worker 启动采集时补写。
+
+汇总：
+    python analytics.py rollup   按题目重算难度与各选项分布，写入 quiz_question_stats，
+                                 供后台仪表盘展示（建议用 cron 每隔几分钟执行一次）
+"""
+
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from database import db, QuizQuestion, QuizAnswer, QuizQuestionStat
+
+# 缓冲达到该数量立即写库
+FLUSH_BATCH_SIZE = 500
+# 否则每隔多少秒写一次
+FLUSH_INTERVAL = 2.0
+# 内存缓冲上限，数据库长时间不可用时丢弃最旧的事件，防止内存无限增长
+MAX_BUFFERED_EVENTS = 50000
+
+
+def validate_answer(raw):
+    """校验单条作答事件，返回规范化的 dict；不合法时返回 None"""
+    if not isinstance(raw, dict):
+        return None
+    question_id, selected = raw.get('question_id'), raw.get('selected')
+    elapsed_ms = raw.get('elapsed_ms')
+    if isinstance(question_id, bool) or not isinstance(question_id, int):
+        return None
+    if isinstance(selected, bool) or not isinstance(selected, int) or not 0 <= selected <= 3:
+        return None
+    if elapsed_ms is not None and (isinstance(elapsed_ms, bool) or not isinstance(elapsed_ms, int) or elapsed_ms < 0):
+        elapsed_ms = None
+    return {
+        'question_id': question_id,
+        'selected': selected,
+        'elapsed_ms': elapsed_ms,
+        'created_at': datetime.utcnow().isoformat(),
+    }
+
+
+class AnswerBuffer:
+    """进程内的写后缓冲；gunicorn --preload 时每个 worker 在首次使用时各自启动刷新线程"""
+
+    def __init__(self, app, spool_dir):
+        self.app = app
+        self.spool_dir = spool_dir
+        self.pid = None
+
+    def _start(self):
+        # fork 之后线程和文件句柄都不会被继承，按进程重新初始化
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.events = []
+        self.flush_seq = 0
+        # 文件名带上每次启动的随机后缀：PID 被复用时也能区分出上一个进程遗留的 spool
+        self.owner = f'{self.pid}-{uuid.uuid4().hex[:12]}'
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.spool_path = os.path.join(self.spool_dir, f'{self.owner}.jsonl')
+        self.spool = open(self.spool_path, 'a', encoding='utf-8')
+        self._recover_spools()
+        threading.Thread(target=self._run, daemon=True, name='answer-flush').start()
+
+    def _ensure_started(self):
+        if self.pid != os.getpid():
+            self._start()
+
+    def add(self, events):
+        self._ensure_started()
+        lines = ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in events)
+        with self.lock:
+            self.events.extend(events)
+            if len(self.events) > MAX_BUFFERED_EVENTS:
+                del self.events[:len(self.events) - MAX_BUFFERED_EVENTS]
+            # 只写入系统缓冲不 fsync：进程崩溃不丢，整机断电可接受丢失最近几秒
+            self.spool.write(lines)
+            self.spool.flush()
+            should_flush = len(self.events) >= FLUSH_BATCH_SIZE
+        if should_flush:
+            self.wakeup.set()
+
+    # ----- spool 文件 -----
+
+    def _recover_spools(self):
+        """接管已退出进程遗留的 spool 文件
+
+        文件名形如 <pid>-<启动后缀>.jsonl。PID 与当前进程相同但后缀不同的，
+        是此前用过同一 PID 的进程留下的，同样需要接管。
+        """
+        for path in glob.glob(os.path.join(self.spool_dir, '*.jsonl')) + \
+                glob.glob(os.path.join(self.spool_dir, '*.flushing')):
+            owner = os.path.basename(path).split('.')[0]
+            owner_pid = owner.split('-')[0]
+            if owner == self.owner or not owner_pid.isdigit():
+                continue
+            if int(owner_pid) != self.pid and _pid_alive(int(owner_pid)):
+                continue
+            claimed = os.path.join(self.spool_dir, f'{self.owner}.recovered-{os.path.basename(path)}.flushing')
+            try:
+                os.rename(path, claimed)  # rename 是原子操作，多个 worker 同时接管时只有一个成功
+            except OSError:
+                continue
+            with open(claimed, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.events.append(json.loads(line))
+                    except ValueError:
+                        pass
+
+    def _rotate_spool(self):
+        """把当前 spool 改名为 .flushing 并新开一个；调用方需持有锁"""
+        self.spool.close()
+        self.flush_seq += 1
+        os.rename(self.spool_path, os.path.join(self.spool_dir, f'{self.owner}.{self.flush_seq}.flushing'))
+        self.spool = open(self.spool_path, 'a', encoding='utf-8')
+
+    def _clear_flushed_spools(self):
+        for path in glob.glob(os.path.join(self.spool_dir, f'{self.owner}.*.flushing')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # ----- 刷新线程 -----
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.events:
+                return 0
+            events, self.events = self.events, []
+            self._rotate_spool()
+        try:
+            with self.app.app_context():
+                written = write_answers(events)
+        except Exception as e:
+            print(f"作答数据写入失败，稍后重试: {e}")
+            with self.lock:
+                # 放回缓冲；对应的 .flushing 文件保留，进程此时退出也能被接管补写
+                self.events[:0] = events
+            return 0
+        self._clear_flushed_spools()
+        return written
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def write_answers(events):
+    """一次批量 INSERT 写入作答事件；判分在这里按题库答案完成，未知题目直接丢弃"""
+    question_ids = {e['question_id'] for e in events}
+    answers = dict(db.session.execute(
+        db.select(QuizQuestion.id, QuizQuestion.answer).where(QuizQuestion.id.in_(question_ids))
+    ).all())
+    rows = [
+        {
+            'question_id': e['question_id'],
+            'selected': e['selected'],
+            'correct': e['selected'] == answers[e['question_id']],
+            'elapsed_ms': e.get('elapsed_ms'),
+            'created_at': datetime.fromisoformat(e['created_at']),
+        }
+        for e in events if e['question_id'] in answers
+    ]
+    if rows:
+        db.session.execute(db.insert(QuizAnswer), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def rollup_answer_stats():
+    """按题目重算作答统计；返回汇总的题目数"""
+    rows = db.session.execute(
+        db.select(
+            QuizAnswer.question_id,
+            QuizAnswer.selected,
+            db.func.count(),
+            # 用时可能缺失：分别取总和与有效条数，不能用平均值乘总次数
+            db.func.sum(QuizAnswer.elapsed_ms),
+            db.func.count(QuizAnswer.elapsed_ms),
+        ).group_by(QuizAnswer.question_id, QuizAnswer.selected)
+    ).all()
+    answers = dict(db.session.execute(db.select(QuizQuestion.id, QuizQuestion.answer)).all())
+
+    per_question = {}
+    for question_id, selected, count, elapsed_sum, timed in rows:
+        stats = per_question.setdefault(question_id, {'options': [0, 0, 0, 0], 'elapsed': 0, 'timed': 0})
+        stats['options'][selected] = count
+        stats['elapsed'] += elapsed_sum or 0
+        stats['timed'] += timed
+
+    now = datetime.utcnow()
+    mappings = []
+    for question_id, stats in per_question.items():
+        if question_id not in answers:
+            continue
+        options = stats['options']
+        attempts = sum(options)
+        correct_count = options[answers[question_id]]
+        wrong = [(count, idx) for idx, count in enumerate(options) if idx != answers[question_id] and count]
+        mappings.append({
+            'question_id': question_id,
+            'attempts': attempts,
+            'correct_count': correct_count,
+            'difficulty': 1 - correct_count / attempts,
+            'option1_count': options[0],
+            'option2_count': options[1],
+            'option3_count': options[2],
+            'option4_count': options[3],
+            'top_distractor': max(wrong)[1] if wrong else None,
+            'avg_elapsed_ms': int(stats['elapsed'] / stats['timed']) if stats['timed'] else None,
+            'updated_at': now,
+        })
+
+    # 整表替换放在一个事务里，仪表盘不会读到半成品
+    db.session.execute(db.delete(QuizQuestionStat))
+    if mappings:
+        db.session.execute(db.insert(QuizQuestionStat), mappings)
+    db.session.commit()
+    return len(mappings)
+
+
+def init_analytics(app):
+    """挂载作答采集缓冲（接口路由在 app.py）"""
+    app.config.setdefault('ANSWER_SPOOL_DIR', os.path.join(app.instance_path, 'answer-spool'))
+    app.extensions['answer_buffer'] = AnswerBuffer(app, app.config['ANSWER_SPOOL_DIR'])
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'rollup':
+        print("用法:")
+        print("  python analytics.py rollup   # 重算题目难度与选项分布")
+        return
+
+    from database import create_db_app
+    app = create_db_app()
+    with app.app_context():
+        started = time.perf_counter()
+        count = rollup_answer_stats()
+        print(f"已汇总 {count} 道题目的作答统计，用时 {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,44 +1,16 @@
 import json
 import os
-from flask import Flask, jsonify, request, render_template, url_for, send_from_directory, redirect
+import threading
+from flask import Flask, Blueprint, Response, current_app, jsonify, request, render_template, url_for, send_from_directory
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-from flask import send_from_directory
 import database
-from database import db, CenterPoint, ArchaeologicalSite, QuizQuestion
-# Admin imports moved to init_admin() in admin.py
-# from flask_admin import Admin
-# from flask_admin.contrib.sqla import ModelView
-# from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-
-# 指向 templates 文件夹
-app = Flask(__name__, template_folder='templates', static_folder='static')
-CORS(app)
-
-# 1. 优先读取环境变量 DATABASE_URL (Docker环境会传这个变量)
-db_url = os.environ.get('DATABASE_URL')
-
-# 2. 如果没读到 (说明是在本地直接运行，没有用 Docker)，就回退用 SQLite
-if db_url is None:
-    # 使用 instance 文件夹下的 chu.db
-    db_path = os.path.join(app.instance_path, 'chu.db')
-    # 确保 instance 目录存在
-    try:
-        os.makedirs(app.instance_path)
-    except OSError:
-        pass
-    db_url = 'sqlite:///' + db_path
-
-# 3. 将最终确定的数据库地址赋值给 Flask 配置
-app.config['SQLALCHEMY_DATABASE_URI'] = db_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev')
-database.init_app(app)
-
-# Admin initialization moved after route definitions to prevent routing conflicts
+from database import db, CenterPoint, ArchaeologicalSite, QuizQuestion, QuestionDifficultyModel, Territory, TerritoryShape
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# 页面与 API 路由统一挂在蓝图上，由 create_app() 注册到具体的 app
+main_bp = Blueprint('main', __name__)
+
 
 def get_file_path(filename):
     return os.path.join(BASE_DIR, filename)
@@ -47,19 +19,18 @@ def get_file_path(filename):
 def load_sites_data():
     """从数据库加载遗址数据"""
     try:
-        with app.app_context():
-            # 获取中心点数据
-            center_point = CenterPoint.query.first()
-            center_point_data = center_point.to_dict() if center_point else {}
-
-            # 获取所有遗址数据
-            sites = ArchaeologicalSite.query.all()
-            sites_data = [site.to_dict() for site in sites]
-
-            return {
-                "center_point": center_point_data,
-                "sites": sites_data
-            }
+        # 获取中心点数据
+        center_point = CenterPoint.query.first()
+        center_point_data = center_point.to_dict() if center_point else {}
+
+        # 获取所有遗址数据
+        sites = ArchaeologicalSite.query.all()
+        sites_data = [site.to_dict() for site in sites]
+
+        return {
+            "center_point": center_point_data,
+            "sites": sites_data
+        }
     except Exception as e:
         print(f"从数据库读取遗址数据失败: {e}")
         return {"error": "Database query failed", "center_point": {}, "sites": []}
@@ -81,32 +52,32 @@ def load_artifacts_data():
 # ===========================
 
 # 首页
-@app.route('/')
-@app.route('/index.html')
+@main_bp.route('/')
+@main_bp.route('/index.html')
 def index():
     return render_template('index.html')
 
 
 # 时空地图页
-@app.route('/map.html')
+@main_bp.route('/map.html')
 def map_page():
     return render_template('map.html')
 
 
 # 文物图鉴页
-@app.route('/gallery.html')
+@main_bp.route('/gallery.html')
 def gallery_page():
     return render_template('gallery.html')
 
 
 # 资料库页
-@app.route('/library.html')
+@main_bp.route('/library.html')
 def library_page():
     return render_template('library.html')
 
 
 # 互动挑战页
-@app.route('/game.html')
+@main_bp.route('/game.html')
 def game_page():
     return render_template('game.html')
 
@@ -115,14 +86,14 @@ def game_page():
 # 2. API 数据接口
 # ===========================
 
-@app.route('/api/sites', methods=['GET'])
+@main_bp.route('/api/sites', methods=['GET'])
 def get_map_data():
     """获取所有遗址数据"""
     data = load_sites_data()
     return jsonify(data)
 
 
-@app.route('/api/sites/filter', methods=['GET'])
+@main_bp.route('/api/sites/filter', methods=['GET'])
 def filter_sites_by_year():
     """根据年份筛选遗址"""
     year_param = request.args.get('year', type=int)
@@ -130,67 +101,125 @@ def filter_sites_by_year():
         return jsonify({"error": "Missing year parameter"}), 400
 
     try:
-        with app.app_context():
-            # 直接从数据库筛选数据
-            filtered_sites = ArchaeologicalSite.query.filter(
-                ArchaeologicalSite.year <= year_param + 30
-            ).all()
-            sites_data = [site.to_dict() for site in filtered_sites]
-            return jsonify({"count": len(sites_data), "sites": sites_data})
+        # 直接从数据库筛选数据
+        filtered_sites = ArchaeologicalSite.query.filter(
+            ArchaeologicalSite.year <= year_param + 30
+        ).all()
+        sites_data = [site.to_dict() for site in filtered_sites]
+        return jsonify({"count": len(sites_data), "sites": sites_data})
     except Exception as e:
         print(f"数据库查询失败: {e}")
         return jsonify({"error": "Database query failed"}), 500
 
 
-@app.route('/api/sites/<int:site_id>', methods=['GET'])
+@main_bp.route('/api/sites/<int:site_id>', methods=['GET'])
 def get_site_detail(site_id):
     """获取特定遗址详情"""
     try:
-        with app.app_context():
-            site = ArchaeologicalSite.query.get(site_id)
-            if site:
-                return jsonify(site.to_dict())
-            else:
-                return jsonify({"error": "Site not found"}), 404
+        site = db.session.get(ArchaeologicalSite, site_id)
+        if site:
+            return jsonify(site.to_dict())
+        else:
+            return jsonify({"error": "Site not found"}), 404
     except Exception as e:
         print(f"数据库查询失败: {e}")
         return jsonify({"error": "Database query failed"}), 500
 
 
-@app.route('/api/artifacts', methods=['GET'])
+@main_bp.route('/api/artifacts', methods=['GET'])
 def get_artifacts():
     data = load_artifacts_data()
     return jsonify(data)
 
-@app.route('/quiz_questions.json')
+@main_bp.route('/quiz_questions.json')
 def serve_quiz_json():
     # 允许浏览器读取根目录下的 quiz_questions.json
-    return send_from_directory('.', 'quiz_questions.json')
+    return send_from_directory(BASE_DIR, 'quiz_questions.json')
 
 
-@app.route('/api/quiz-questions', methods=['GET'])
+@main_bp.route('/api/quiz-questions', methods=['GET'])
 def get_quiz_questions():
-    """获取5道随机题库题目"""
+    """获取5道随机题库题目；adaptive=1 时按 level（easy/medium/hard）做难度加权抽题"""
     try:
-        with app.app_context():
-            questions = QuizQuestion.query.order_by(db.func.random()).limit(5).all()
+        if request.args.get('adaptive') == '1':
+            level = request.args.get('level', 'medium')
+            if level not in QuestionDifficultyModel.LEVEL_TARGETS:
+                return jsonify({"error": "Invalid level"}), 400
+            ids = current_app.extensions['difficulty_model'].draw(level, 5)
+            # 按主键取回，保持抽样顺序
+            by_id = {q.id: q for q in QuizQuestion.query.filter(QuizQuestion.id.in_(ids)).all()}
+            questions = [by_id[i] for i in ids if i in by_id]
+            if len(questions) < 5:
+                # 别名表尚未刷新时可能抽到已删除的题目，不足的部分均匀随机补齐
+                questions += QuizQuestion.query.filter(
+                    QuizQuestion.id.notin_([q.id for q in questions])
+                ).order_by(db.func.random()).limit(5 - len(questions)).all()
             return jsonify([q.to_dict() for q in questions])
+
+        questions = QuizQuestion.query.order_by(db.func.random()).limit(5).all()
+        return jsonify([q.to_dict() for q in questions])
     except Exception as e:
         print(f"数据库查询失败: {e}")
         return jsonify({"error": "Database query failed"}), 500
 
 
+@main_bp.route('/api/quiz-answers', methods=['POST'])
+def ingest_quiz_answers():
+    """记录玩家作答：只校验并放入缓冲，由后台线程批量入库"""
+    payload = request.get_json(silent=True)
+    events = payload if isinstance(payload, list) else [payload]
+    if len(events) > 50:
+        return jsonify({"error": "Too many events"}), 413
 
+    from analytics import validate_answer
+    valid = [e for e in (validate_answer(raw) for raw in events) if e is not None]
+    if not valid:
+        return jsonify({"error": "Invalid answer event"}), 400
+    current_app.extensions['answer_buffer'].add(valid)
+    return jsonify({"accepted": len(valid)}), 202
+
+
+@main_bp.route('/api/territory', methods=['GET'])
+def get_territory():
+    """返回某一年份的楚国疆域，几何按缩放级别预先简化（TopoJSON）"""
+    year = request.args.get('year', type=int)
+    if year is None:
+        return jsonify({"error": "Missing year parameter"}), 400
+    zoom = request.args.get('zoom', default=6, type=int)
+
+    try:
+        territory = Territory.query.filter(
+            Territory.start_year <= year, Territory.end_year >= year
+        ).order_by(Territory.start_year.desc()).first()
+        if territory is None:
+            return jsonify({"error": "Territory not found"}), 404
+
+        # 取不超过当前缩放级别的最精细一档；比所有档都小时用最粗的一档
+        shape = TerritoryShape.query.filter(
+            TerritoryShape.territory_id == territory.id, TerritoryShape.zoom <= zoom
+        ).order_by(TerritoryShape.zoom.desc()).first() or TerritoryShape.query.filter_by(
+            territory_id=territory.id
+        ).order_by(TerritoryShape.zoom.asc()).first()
+        if shape is None:
+            return jsonify({"error": "Territory not found"}), 404
+    except Exception as e:
+        print(f"数据库查询失败: {e}")
+        return jsonify({"error": "Database query failed"}), 500
+
+    # 几何已在导入时序列化，这里直接返回原文
+    response = Response(shape.topology, mimetype='application/json')
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
 
 
 # ===========================
 # 3. 资料库文件服务
 # ===========================
 
-MATERIALS_FOLDER = os.path.join(app.static_folder, 'materials')
+MATERIALS_FOLDER = os.path.join(BASE_DIR, 'static', 'materials')
 
 
-@app.route('/api/materials', methods=['GET'])
+@main_bp.route('/api/materials', methods=['GET'])
 def list_materials():
     files_list = []
 
@@ -210,24 +239,117 @@ def list_materials():
     return jsonify(files_list)
 
 
-@app.route('/api/download/<path:filename>')
+@main_bp.route('/api/download/<path:filename>')
 def download_file(filename):
     return send_from_directory(MATERIALS_FOLDER, filename, as_attachment=True)
 
-# app.py
-@app.route('/admin/static/<path:filename>.map')
+
+# ===========================
+# 4. 应用工厂
+# ===========================
+
 def no_map(filename):
+    # 后台静态资源的 source map 不提供，避免浏览器控制台报 404
     return '', 204
-# Removed deprecated before_first_request - tables created in main block
 
-# Initialize admin after all route definitions to prevent routing conflicts
-from admin import init_admin
-init_admin(app)
+
+def create_admin_app(app):
+    """构建挂在 /admin 下的后台应用（Flask-Admin + Bootstrap 主题）
+
+    与主应用共用同一份配置（SECRET_KEY、数据库地址等），登录会话 cookie 互通。
+    """
+    admin_app = Flask(__name__, template_folder='templates', static_folder='static')
+    admin_app.config.update(app.config)
+    database.init_app(admin_app)
+    admin_app.add_url_rule('/admin/static/<path:filename>.map', 'no_map', no_map)
+
+    from admin import init_admin
+    init_admin(admin_app)
+
+    from instrumentation import init_instrumentation
+    init_instrumentation(admin_app)
+    return admin_app
+
+
+class LazyAdminDispatcher:
+    """WSGI 中间件：/admin 开头的请求交给后台应用，其余交给主应用
+
+    后台应用在第一次访问 /admin 时才导入并构建，只浏览前台的 worker 不会加载 Flask-Admin。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self.admin_app = None
+        self.lock = threading.Lock()
+
+    def get_admin_app(self):
+        if self.admin_app is None:
+            with self.lock:
+                if self.admin_app is None:
+                    self.admin_app = create_admin_app(self.app)
+        return self.admin_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path == '/admin' or path.startswith('/admin/'):
+            return self.get_admin_app().wsgi_app(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+
+def create_app(config=None):
+    """创建并配置 Flask 应用
+
+    后台管理在首次访问 /admin 时才加载（见 LazyAdminDispatcher），
+    设置 CHU_ENABLE_ADMIN=0 可以让纯前台实例完全不挂载后台。
+    """
+    # 指向 templates 文件夹
+    app = Flask(__name__, template_folder='templates', static_folder='static')
+    if config:
+        app.config.update(config)
+    app.config.setdefault('ADMIN_ENABLED', os.getenv('CHU_ENABLE_ADMIN', '1') == '1')
+
+    CORS(app)
+    database.init_app(app)
+    app.register_blueprint(main_bp)
+
+    # 地图数据快照：模板变量 + 遗址/中心点提交后自动重建
+    from snapshot import init_snapshot
+    init_snapshot(app)
+
+    # 答题数据写后缓冲
+    from analytics import init_analytics
+    init_analytics(app)
+
+    # 可选的性能观测（CHU_INSTRUMENTATION=1 时开启）
+    from instrumentation import init_instrumentation
+    init_instrumentation(app)
+
+    # 热点接口按客户端限流（在观测之后注册，429 也会计入 /metrics）
+    from ratelimit import init_rate_limit
+    init_rate_limit(app)
+
+    # 后台挂在 WSGI 层，按需构建；所有配置就绪后再包装，后台应用能拿到完整配置
+    if app.config['ADMIN_ENABLED']:
+        app.wsgi_app = LazyAdminDispatcher(app)
+
+    return app
+
+
+def __getattr__(name):
+    # 兼容 `gunicorn app:app` 与 `from app import app`：首次访问时才创建应用
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
     # host='0.0.0.0' 允许外网/局域网访问
     # debug=False 关闭调试模式，生产环境建议关闭
+    app = create_app()
     with app.app_context():
         db.create_all()  # 确保在应用启动时创建表
     print(f"服务启动成功! 请访问: http://0.0.0.0:5000")
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=False)
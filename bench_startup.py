@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准：在独立子进程中分别测量各导入路径的耗时与常驻内存
+
+用法:
+    python bench_startup.py                        # 每种路径运行 5 次
+    python bench_startup.py 20                     # 每种路径运行 20 次
+    python bench_startup.py 20 --baseline <commit> # 另在该提交的 git worktree 中测量 `from app import app`，作为对比基线
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# 每个场景在全新的解释器里执行，输出 {"seconds": ..., "maxrss_kb": ...}
+SCENARIOS = {
+    '仅数据库 (migrate.py)': 'from database import create_db_app; create_db_app()',
+    '前台应用 (无后台)': 'from app import create_app; create_app({"ADMIN_ENABLED": False})',
+    '完整应用 (后台按需加载)': 'from app import create_app; create_app()',
+    '完整应用 + 首次访问后台': 'from app import create_app; create_app().test_client().get("/admin/login")',
+}
+
+RUNNER = '''
+import json, resource, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+'''
+
+
+def run_once(code, cwd=None):
+    output = subprocess.check_output([sys.executable, '-c', RUNNER.format(code=code)], cwd=cwd)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def report(name, code, rounds, cwd=None):
+    results = [run_once(code, cwd) for _ in range(rounds)]
+    seconds = statistics.median(r['seconds'] for r in results)
+    rss = max(r['maxrss_kb'] for r in results) / 1024
+    print(f"{name:<24}{seconds * 1000:>14.1f}{rss:>14.1f}")
+
+
+def report_baseline(ref, rounds):
+    """在指定提交的临时 worktree 中测量旧版本的模块级应用（改造前 migrate.py 也走这条路径）"""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    worktree = tempfile.mkdtemp(prefix='chu-bench-')
+    subprocess.check_call(['git', 'worktree', 'add', '--detach', '--quiet', worktree, ref], cwd=repo_dir)
+    try:
+        report(f'基线 {ref[:10]}', 'from app import app', rounds, cwd=worktree)
+    finally:
+        subprocess.call(['git', 'worktree', 'remove', '--force', worktree], cwd=repo_dir)
+
+
+def main():
+    args = sys.argv[1:]
+    baseline = None
+    if '--baseline' in args:
+        index = args.index('--baseline')
+        baseline = args[index + 1]
+        del args[index:index + 2]
+    rounds = int(args[0]) if args else 5
+
+    print(f"{'场景':<24}{'中位耗时(ms)':>14}{'最大RSS(MB)':>14}")
+    if baseline:
+        report_baseline(baseline, rounds)
+    for name, code in SCENARIOS.items():
+        report(name, code, rounds)
+
+
+if __name__ == '__main__':
+    main()
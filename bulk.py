@@ -0,0 +1,201 @@
+"""
+批量写入：解析 JSON Lines 操作、按模型的 CheckConstraint 预先校验、分块事务写入
+
+每行一个操作：
+    {"op": "create", "model": "site", "data": {"name": "...", "year": -400, ...}}
+    {"op": "update", "model": "quiz", "id": 12, "data": {"explanation": "..."}}
+    {"op": "delete", "model": "center", "id": 3}
+"""
+
+import json
+import re
+
+from database import db, CenterPoint, ArchaeologicalSite, QuizQuestion
+
+BULK_MODELS = {
+    'site': ArchaeologicalSite,
+    'center': CenterPoint,
+    'quiz': QuizQuestion,
+}
+BULK_OPS = ('create', 'update', 'delete')
+
+# 每个事务处理的行数
+BULK_CHUNK_SIZE = 500
+# 单次请求最多允许的行数
+BULK_MAX_ROWS = 20000
+
+# 不允许客户端写入的列
+READONLY_COLUMNS = ('id', 'created_at', 'updated_at')
+
+_BETWEEN_RE = re.compile(r'^\s*(\w+)\s+BETWEEN\s+(-?\d+)\s+AND\s+(-?\d+)\s*$', re.IGNORECASE)
+
+
+class BulkError(ValueError):
+    pass
+
+
+def _range_checks(model):
+    """从模型的 CheckConstraint（形如 `col BETWEEN a AND b`）提取取值范围"""
+    checks = {}
+    for constraint in model.__table__.constraints:
+        if isinstance(constraint, db.CheckConstraint):
+            match = _BETWEEN_RE.match(str(constraint.sqltext))
+            if match:
+                checks[match.group(1)] = (int(match.group(2)), int(match.group(3)), constraint.name)
+    return checks
+
+
+def _writable_columns(model):
+    return {c.name: c for c in model.__table__.columns if c.name not in READONLY_COLUMNS}
+
+
+def _check_value(column, value):
+    if value is None:
+        if not column.nullable:
+            raise BulkError(f"{column.name} 不能为空")
+        return value
+    python_type = column.type.python_type
+    if python_type is int:
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise BulkError(f"{column.name} 必须为整数")
+    elif python_type is float:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise BulkError(f"{column.name} 必须为数字")
+        value = float(value)
+    elif python_type is str:
+        if not isinstance(value, str):
+            raise BulkError(f"{column.name} 必须为字符串")
+        length = getattr(column.type, 'length', None)
+        if length and len(value) > length:
+            raise BulkError(f"{column.name} 超过最大长度 {length}")
+    return value
+
+
+def validate_operation(raw):
+    """校验单行操作，返回规范化后的 (op, model_key, id, data)"""
+    if not isinstance(raw, dict):
+        raise BulkError("每行必须是 JSON 对象")
+    op, model_key = raw.get('op'), raw.get('model')
+    if op not in BULK_OPS:
+        raise BulkError(f"未知操作: {op}")
+    if model_key not in BULK_MODELS:
+        raise BulkError(f"未知模型: {model_key}")
+    model = BULK_MODELS[model_key]
+
+    row_id = raw.get('id')
+    if op in ('update', 'delete') and (isinstance(row_id, bool) or not isinstance(row_id, int)):
+        raise BulkError(f"{op} 操作需要整数 id")
+    if op == 'delete':
+        return op, model_key, row_id, {}
+
+    data = raw.get('data')
+    if not isinstance(data, dict) or not data:
+        raise BulkError("缺少 data")
+    columns = _writable_columns(model)
+    unknown = set(data) - set(columns)
+    if unknown:
+        raise BulkError(f"未知字段: {', '.join(sorted(unknown))}")
+    if op == 'create':
+        missing = [name for name, c in columns.items()
+                   if not c.nullable and c.default is None and c.server_default is None and name not in data]
+        if missing:
+            raise BulkError(f"缺少必填字段: {', '.join(missing)}")
+
+    clean = {name: _check_value(columns[name], value) for name, value in data.items()}
+    for name, (low, high, constraint_name) in _range_checks(model).items():
+        if name in clean and clean[name] is not None and not low <= clean[name] <= high:
+            raise BulkError(f"{name} 超出范围 [{low}, {high}]（{constraint_name}）")
+    return op, model_key, row_id, clean
+
+
+def parse_and_validate(lines):
+    """逐行解析并校验；返回 (有效操作列表, 错误结果列表)。行号从 1 开始"""
+    operations, errors = [], []
+    # 块内按 创建→更新→删除 分组执行，删除之后再操作同一条记录的结果会与实际不符，提前拒绝
+    deleted_at = {}
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            op = validate_operation(json.loads(line))
+            target = (op[1], op[2])
+            if op[0] != 'create' and target in deleted_at:
+                raise BulkError(f"该记录已在第 {deleted_at[target]} 行删除")
+            if op[0] == 'delete':
+                deleted_at[target] = line_no
+            operations.append((line_no,) + op)
+        except json.JSONDecodeError as e:
+            errors.append({'line': line_no, 'status': 'error', 'error': f"JSON 解析失败: {e.msg}"})
+        except BulkError as e:
+            errors.append({'line': line_no, 'status': 'error', 'error': str(e)})
+        if len(operations) + len(errors) > BULK_MAX_ROWS:
+            raise BulkError(f"单次最多提交 {BULK_MAX_ROWS} 行")
+    return operations, errors
+
+
+def _apply_chunk(chunk):
+    """在一个事务中执行一批操作，返回每行结果"""
+    session = db.session
+    results = {}
+
+    # 更新/删除的目标先一次性查出是否存在
+    targets = {}
+    for line_no, op, model_key, row_id, data in chunk:
+        if op != 'create':
+            targets.setdefault(model_key, set()).add(row_id)
+    existing = {}
+    for model_key, ids in targets.items():
+        model = BULK_MODELS[model_key]
+        existing[model_key] = set(session.scalars(db.select(model.id).where(model.id.in_(ids))))
+
+    creates, updates, deletes = [], {}, {}
+    for line_no, op, model_key, row_id, data in chunk:
+        if op != 'create' and row_id not in existing[model_key]:
+            results[line_no] = {'line': line_no, 'status': 'error', 'id': row_id, 'error': '记录不存在'}
+        elif op == 'create':
+            creates.append((line_no, BULK_MODELS[model_key](**data)))
+        elif op == 'update':
+            updates.setdefault(model_key, []).append((line_no, dict(data, id=row_id)))
+        else:
+            deletes.setdefault(model_key, []).append((line_no, row_id))
+
+    session.add_all([obj for _, obj in creates])
+    for model_key, items in updates.items():
+        session.bulk_update_mappings(BULK_MODELS[model_key], [mapping for _, mapping in items])
+    for model_key, items in deletes.items():
+        model = BULK_MODELS[model_key]
+        session.execute(db.delete(model).where(model.id.in_([row_id for _, row_id in items])))
+    session.flush()
+
+    for line_no, obj in creates:
+        results[line_no] = {'line': line_no, 'status': 'created', 'id': obj.id}
+    for items, status in ((updates, 'updated'), (deletes, 'deleted')):
+        for entries in items.values():
+            for line_no, value in entries:
+                row_id = value['id'] if isinstance(value, dict) else value
+                results[line_no] = {'line': line_no, 'status': status, 'id': row_id}
+    return [results[line_no] for line_no, *_ in chunk]
+
+
+def apply_operations(operations, chunk_size=BULK_CHUNK_SIZE):
+    """分块提交；某一块失败只回滚该块，其余块照常写入。返回 (每行结果, 是否改动了地图数据)"""
+    from snapshot import SNAPSHOT_MODELS
+
+    results = []
+    map_touched = False
+    for start in range(0, len(operations), chunk_size):
+        chunk = operations[start:start + chunk_size]
+        try:
+            chunk_results = _apply_chunk(chunk)
+            # 快照在全部完成后统一重建一次，不必每块提交都重建
+            db.session.info.pop('map_snapshot_dirty', None)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            chunk_results = [{'line': line_no, 'status': 'error', 'id': row_id, 'error': f"写入失败: {e.__class__.__name__}"}
+                             for line_no, op, model_key, row_id, data in chunk]
+        results.extend(chunk_results)
+        for (line_no, op, model_key, row_id, data), result in zip(chunk, chunk_results):
+            if result['status'] != 'error' and BULK_MODELS[model_key] in SNAPSHOT_MODELS:
+                map_touched = True
+    return results, map_touched
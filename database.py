@@ -4,15 +4,18 @@
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager
+import json
+import math
 import os
+import random
 import secrets
+import threading
+import time
 
 # 初始化核心组件
 db = SQLAlchemy()
-login_manager = LoginManager()
 
-# 注意：Admin 的初始化已经移动到 admin.py，这里不再保留
+# 注意：Admin 与登录管理的初始化都在 admin.py，这里只负责数据库
 
 # ===== 1. 数据库模型定义 =====
 
@@ -43,7 +46,7 @@ class ArchaeologicalSite(db.Model):
     location = db.Column(db.String(100), nullable=False)
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
-    year = db.Column(db.Integer, nullable=False)
+    year = db.Column(db.Integer, nullable=False, index=True)
     description = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_at = db.Column(db.DateTime, onupdate=db.func.current_timestamp())
@@ -74,7 +77,7 @@ class QuizQuestion(db.Model):
     option2 = db.Column(db.String(100), nullable=False)
     option3 = db.Column(db.String(100), nullable=False)
     option4 = db.Column(db.String(100), nullable=False)
-    answer = db.Column(db.Integer, nullable=False)
+    answer = db.Column(db.Integer, nullable=False, index=True)
     explanation = db.Column(db.Text, nullable=False)
 
     __table_args__ = (
@@ -91,22 +94,245 @@ class QuizQuestion(db.Model):
             'explanation': self.explanation
         }
 
+class QuizAnswer(db.Model):
+    """玩家作答记录（由 analytics.py 批量写入）"""
+    __tablename__ = 'quiz_answers'
+
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('quiz_questions.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    selected = db.Column(db.Integer, nullable=False)
+    correct = db.Column(db.Boolean, nullable=False)
+    elapsed_ms = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.CheckConstraint('selected BETWEEN 0 AND 3', name='valid_selected_range'),
+    )
+
+
+class QuizQuestionStat(db.Model):
+    """按题目汇总的作答统计（由 rollup 任务整体重算）"""
+    __tablename__ = 'quiz_question_stats'
+
+    question_id = db.Column(db.Integer, db.ForeignKey('quiz_questions.id', ondelete='CASCADE'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    # 难度 = 答错比例，0 最容易，1 最难
+    difficulty = db.Column(db.Float, nullable=False, default=0.0)
+    # 各选项被选次数，用于分析干扰项
+    option1_count = db.Column(db.Integer, nullable=False, default=0)
+    option2_count = db.Column(db.Integer, nullable=False, default=0)
+    option3_count = db.Column(db.Integer, nullable=False, default=0)
+    option4_count = db.Column(db.Integer, nullable=False, default=0)
+    # 被选最多的错误选项（0-3），没有人答错时为空
+    top_distractor = db.Column(db.Integer)
+    avg_elapsed_ms = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    question = db.relationship('QuizQuestion')
+
+    def option_counts(self):
+        return [self.option1_count, self.option2_count, self.option3_count, self.option4_count]
+
+
+# ===== 题目难度模型（自适应抽题） =====
+
+def build_alias_table(weights):
+    """Vose 别名法：O(n) 预处理后每次按权重抽样为 O(1)"""
+    n = len(weights)
+    total = float(sum(weights))
+    prob = [w * n / total for w in weights]
+    alias = [0] * n
+    small = [i for i, p in enumerate(prob) if p < 1.0]
+    large = [i for i, p in enumerate(prob) if p >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        alias[s] = l
+        prob[l] -= 1.0 - prob[s]
+        (small if prob[l] < 1.0 else large).append(l)
+    for i in small + large:
+        prob[i] = 1.0
+    return prob, alias
+
+
+class QuestionDifficultyModel:
+    """每个 worker 内存中的题目难度估计与各档位的别名表
+
+    难度来自 quiz_question_stats 中的作答结果（rollup 汇总），按伪计数向先验收缩：
+        difficulty = (答错次数 + 先验 * PRIOR_WEIGHT) / (作答次数 + PRIOR_WEIGHT)
+    先验取静态种子文件中的值（QUIZ_DIFFICULTY_SEED，{"题目 id": 0~1}），没有时为 0.5。
+    每个档位按难度与目标值的距离给出权重，刷新时一次性建好别名表，
+    抽 k 道题只需 O(k) 次别名抽样，与题库大小无关。
+    """
+
+    LEVEL_TARGETS = {'easy': 0.2, 'medium': 0.45, 'hard': 0.7}
+    PRIOR_WEIGHT = 5
+    # 权重的高斯宽度：越小越集中在目标难度附近
+    SPREAD = 0.15
+    REFRESH_INTERVAL = 300
+
+    def __init__(self, app):
+        self.app = app
+        self.state = None          # (题目 id 列表, 难度列表, {档位: (prob, alias)})
+        self.refreshed_at = 0.0
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+    def _load_seed(self):
+        path = self.app.config.get('QUIZ_DIFFICULTY_SEED')
+        if not path or not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return {int(k): float(v) for k, v in json.load(f).items()}
+
+    def refresh(self):
+        """重新读取题库与作答统计并重建别名表（需在 app context 中调用）"""
+        seed = self._load_seed()
+        stats = {
+            question_id: (attempts, correct_count)
+            for question_id, attempts, correct_count in db.session.execute(
+                db.select(QuizQuestionStat.question_id, QuizQuestionStat.attempts, QuizQuestionStat.correct_count)
+            )
+        }
+        ids, difficulties = [], []
+        for (question_id,) in db.session.execute(db.select(QuizQuestion.id).order_by(QuizQuestion.id)):
+            prior = seed.get(question_id, 0.5)
+            attempts, correct_count = stats.get(question_id, (0, 0))
+            wrong = attempts - correct_count
+            ids.append(question_id)
+            difficulties.append((wrong + prior * self.PRIOR_WEIGHT) / (attempts + self.PRIOR_WEIGHT))
+
+        tables = {}
+        if ids:
+            for level, target in self.LEVEL_TARGETS.items():
+                weights = [math.exp(-((d - target) ** 2) / (2 * self.SPREAD ** 2)) + 1e-6 for d in difficulties]
+                tables[level] = build_alias_table(weights)
+        # 整体替换引用，正在抽样的请求仍使用旧快照
+        self.state = (ids, difficulties, tables)
+        self.refreshed_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        try:
+            with self.app.app_context():
+                self.refresh()
+        except Exception as e:
+            print(f"题目难度模型刷新失败: {e}")
+        finally:
+            self.refreshing = False
+
+    def _ensure_fresh(self):
+        if self.state is None:
+            # 首次使用同步加载
+            self.refresh()
+            return
+        if time.monotonic() - self.refreshed_at < self.REFRESH_INTERVAL:
+            return
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True, name='difficulty-refresh').start()
+
+    def draw(self, level, k, rng=random):
+        """按档位加权抽取 k 道不重复的题目 id"""
+        self._ensure_fresh()
+        ids, _, tables = self.state
+        if level not in tables:
+            return []
+        k = min(k, len(ids))
+        prob, alias = tables[level]
+        n = len(ids)
+        chosen = []
+        seen = set()
+        # 重复时重抽；k 远小于题库时期望次数约为 k
+        attempts = 0
+        while len(chosen) < k and attempts < k * 20:
+            attempts += 1
+            i = rng.randrange(n)
+            if rng.random() >= prob[i]:
+                i = alias[i]
+            if i not in seen:
+                seen.add(i)
+                chosen.append(ids[i])
+        # 权重极度集中时用均匀抽样补齐
+        while len(chosen) < k:
+            i = rng.randrange(n)
+            if i not in seen:
+                seen.add(i)
+                chosen.append(ids[i])
+        return chosen
+
+
+class Territory(db.Model):
+    """楚国疆域：某一年代区间内的边界多边形"""
+    __tablename__ = 'territories'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    start_year = db.Column(db.Integer, nullable=False, index=True)
+    end_year = db.Column(db.Integer, nullable=False, index=True)
+    description = db.Column(db.Text, nullable=False, default='')
+
+    shapes = db.relationship('TerritoryShape', backref='territory', cascade='all, delete-orphan',
+                             order_by='TerritoryShape.zoom')
+
+    __table_args__ = (
+        db.CheckConstraint('start_year BETWEEN -1100 AND -221', name='valid_territory_start'),
+        db.CheckConstraint('end_year >= start_year', name='valid_territory_range'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'start_year': self.start_year,
+            'end_year': self.end_year,
+            'description': self.description
+        }
+
+
+class TerritoryShape(db.Model):
+    """疆域在某一缩放级别下预先简化、量化好的 TopoJSON 几何"""
+    __tablename__ = 'territory_shapes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    territory_id = db.Column(db.Integer, db.ForeignKey('territories.id', ondelete='CASCADE'), nullable=False)
+    zoom = db.Column(db.Integer, nullable=False)         # 适用的最小地图缩放级别
+    tolerance = db.Column(db.Float, nullable=False)      # Douglas–Peucker 容差（度）
+    point_count = db.Column(db.Integer, nullable=False)
+    topology = db.Column(db.Text, nullable=False)        # 序列化好的 TopoJSON，接口直接返回
+
+    __table_args__ = (
+        db.UniqueConstraint('territory_id', 'zoom', name='uq_territory_zoom'),
+    )
+
 # ===== 2. 初始化函数 =====
 
 def init_app(app: Flask):
-    """初始化数据库配置"""
-    # 配置密钥（用于Session）
-    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') or secrets.token_hex(32)
+    """初始化数据库配置（只在这里配置一次，已有的配置不会被覆盖）"""
+    # 配置密钥（用于Session）；--preload 时只在 master 生成一次，各 worker 共享
+    if not app.config.get('SECRET_KEY'):
+        app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') or secrets.token_hex(32)
 
     # 数据库配置
     basedir = os.path.abspath(os.path.dirname(__file__))
     # 优先读取环境变量，否则使用本地 sqlite
     db_uri = os.getenv('DATABASE_URL', f'sqlite:///{os.path.join(basedir, "chu.db")}')
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', db_uri)
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
 
     # 绑定扩展到 app
     db.init_app(app)
 
-    # 配置登录管理（仅初始化，具体视图在 admin.py 中指定）
-    login_manager.init_app(app)
\ No newline at end of file
+    # 自适应抽题的难度模型（首次抽题时加载，之后按 REFRESH_INTERVAL 在后台刷新）
+    app.config.setdefault('QUIZ_DIFFICULTY_SEED', os.getenv('QUIZ_DIFFICULTY_SEED',
+                                                            os.path.join(basedir, 'quiz_difficulty_seed.json')))
+    app.extensions['difficulty_model'] = QuestionDifficultyModel(app)
+
+
+def create_db_app():
+    """只包含数据库的最小 Flask 应用，供 migrate.py 等命令行脚本使用"""
+    app = Flask(__name__)
+    init_app(app)
+    return app
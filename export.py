@@ -0,0 +1,131 @@
+"""
+数据导出模块：流式导出整表，内存占用与表大小无关
+
+- 服务端游标 + yield_per 分批读取（Postgres 上为 named cursor，不会一次取回整表）
+- CSV：生成器逐批输出，边查边发
+- XLSX：XlsxWriter constant_memory 模式逐行写入临时文件，写完后分块发送；
+  超过单个工作表的行数上限时续写到 <表名>_2、<表名>_3 ... 工作表
+
+XLSX 要等临时文件写完才开始发送，大表导出时间可能超过 gunicorn 的 worker 超时
+（gunicorn.conf.py 中的 GUNICORN_TIMEOUT）；百万行级别的数据建议导出 CSV。
+"""
+
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+from datetime import datetime
+
+from flask import Response, stream_with_context
+
+from database import db
+
+# 每批从数据库读取的行数
+EXPORT_BATCH_SIZE = 1000
+# 发送临时文件时的块大小
+FILE_CHUNK_SIZE = 64 * 1024
+# Excel 单个工作表的最大行数（含表头）
+XLSX_MAX_ROWS = 1048576
+
+
+def iter_rows(model, batch_size=EXPORT_BATCH_SIZE):
+    """按主键顺序流式读取整表，返回 (表头, 行迭代器)"""
+    columns = list(model.__table__.columns)
+    stmt = db.select(*columns).order_by(model.__table__.primary_key.columns.values()[0])
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    return [c.name for c in columns], result
+
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+def generate_csv(model):
+    header, rows = iter_rows(model)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # 客户端中途断开时生成器被关闭，也要及时释放服务端游标
+    try:
+        # UTF-8 BOM，Excel 直接打开中文不乱码
+        yield '\ufeff'
+        writer.writerow(header)
+        for batch in rows.partitions():
+            writer.writerows([_format_value(v) for v in row] for row in batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    finally:
+        rows.close()
+    yield buffer.getvalue()
+
+
+def generate_xlsx(model):
+    import xlsxwriter
+
+    header, rows = iter_rows(model)
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        # constant_memory：每写完一行就刷到磁盘，工作簿大小不影响内存
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+        sheet_no = 1
+        sheet = workbook.add_worksheet(model.__tablename__[:31])
+        sheet.write_row(0, 0, header)
+        row_idx = 1
+        try:
+            for batch in rows.partitions():
+                for row in batch:
+                    if row_idx >= XLSX_MAX_ROWS:
+                        # 当前工作表已满，换新表并重写表头
+                        sheet_no += 1
+                        suffix = f'_{sheet_no}'
+                        sheet = workbook.add_worksheet(model.__tablename__[:31 - len(suffix)] + suffix)
+                        sheet.write_row(0, 0, header)
+                        row_idx = 1
+                    if sheet.write_row(row_idx, 0, [_format_value(v) for v in row]) == -1:
+                        # XlsxWriter 对越界的行只返回 -1 而不报错，不能让数据悄悄丢失
+                        raise ValueError(f"XLSX 写入第 {row_idx} 行失败")
+                    row_idx += 1
+        finally:
+            rows.close()
+        workbook.close()
+
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+EXPORT_FORMATS = {
+    'csv': (generate_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (generate_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def available_formats():
+    """XLSX 依赖可选的 XlsxWriter，未安装时只提供 CSV"""
+    formats = ['csv']
+    if importlib.util.find_spec('xlsxwriter') is not None:
+        formats.append('xlsx')
+    return formats
+
+
+def export_response(model, fmt):
+    """返回流式下载响应；fmt 不支持时返回 None"""
+    if fmt not in available_formats():
+        return None
+    generator, mimetype = EXPORT_FORMATS[fmt]
+    filename = f"{model.__tablename__}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(generator(model)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
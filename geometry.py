@@ -0,0 +1,147 @@
+"""
+疆域多边形的简化与量化
+
+导入时对每个疆域按若干缩放级别分别做 Douglas–Peucker 简化，再量化为整数网格、
+差分编码成 TopoJSON Topology。接口按地图缩放级别直接返回对应的预计算结果，
+滑动时间轴时每次只需传输几 KB。
+"""
+
+import json
+import math
+
+# 预计算的地图缩放级别（与 mapModule.js 中 minZoom/maxZoom 对应）
+SHAPE_ZOOMS = (5, 7, 9, 11)
+
+
+def tolerance_for_zoom(zoom):
+    """该缩放级别下约 1 像素对应的经纬度跨度（256px 瓦片）"""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def _segment_distance(point, start, end):
+    """点到线段的平面距离（经纬度坐标，疆域尺度下足够精确）"""
+    px, py = point
+    ax, ay = start
+    bx, by = end
+    dx, dy = bx - ax, by - ay
+    if dx == 0 and dy == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def douglas_peucker(points, tolerance):
+    """Douglas–Peucker 折线简化（迭代实现，避免长边界递归过深）"""
+    if len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_dist, index = 0.0, None
+        for i in range(first + 1, last):
+            dist = _segment_distance(points[i], points[first], points[last])
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if index is not None and max_dist > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def simplify_ring(ring, tolerance):
+    """简化闭合环；退化到不足 4 个点（三角形 + 闭合点）时返回 None"""
+    if ring[0] != ring[-1]:
+        ring = list(ring) + [ring[0]]
+    simplified = douglas_peucker(ring, tolerance)
+    if len(simplified) < 4:
+        return None
+    return simplified
+
+
+def normalize_polygons(geometry):
+    """GeoJSON Polygon / MultiPolygon -> [[外环, 内环...], ...]"""
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    raise ValueError(f"不支持的几何类型: {geometry['type']}")
+
+
+def simplify_polygons(polygons, tolerance):
+    result = []
+    for polygon in polygons:
+        exterior = simplify_ring(polygon[0], tolerance)
+        if exterior is None:
+            # 外环太小被简化掉时保留原样，小多边形本身点数也不多
+            exterior = polygon[0]
+        holes = [h for h in (simplify_ring(ring, tolerance) for ring in polygon[1:]) if h is not None]
+        result.append([exterior] + holes)
+    return result
+
+
+def _quantize_ring(ring, translate, step):
+    """量化到整数网格并差分编码；量化后重复的点一并去除"""
+    arc = []
+    prev_x = prev_y = None
+    for lng, lat in ring:
+        x = round((lng - translate[0]) / step)
+        y = round((lat - translate[1]) / step)
+        if prev_x is None:
+            arc.append([x, y])
+        elif (x, y) != (prev_x, prev_y):
+            arc.append([x - prev_x, y - prev_y])
+        else:
+            continue
+        prev_x, prev_y = x, y
+    return arc
+
+
+def to_topology(polygons, tolerance, properties=None):
+    """把简化后的多边形编码为 TopoJSON Topology（每个环一条 arc）
+
+    量化步长取容差的一半，误差始终小于简化本身带来的误差。
+    """
+    xs = [p[0] for polygon in polygons for ring in polygon for p in ring]
+    ys = [p[1] for polygon in polygons for ring in polygon for p in ring]
+    step = tolerance / 2
+    translate = [min(xs), min(ys)]
+
+    arcs = []
+    object_arcs = []
+    for polygon in polygons:
+        rings = []
+        for ring in polygon:
+            arcs.append(_quantize_ring(ring, translate, step))
+            rings.append([len(arcs) - 1])
+        object_arcs.append(rings)
+
+    topology = {
+        'type': 'Topology',
+        'bbox': [min(xs), min(ys), max(xs), max(ys)],
+        'transform': {'scale': [step, step], 'translate': translate},
+        'objects': {
+            'territory': {
+                'type': 'MultiPolygon',
+                'arcs': object_arcs,
+                'properties': properties or {},
+            }
+        },
+        'arcs': arcs,
+    }
+    point_count = sum(len(arc) for arc in arcs)
+    return json.dumps(topology, ensure_ascii=False, separators=(',', ':')), point_count
+
+
+def build_shapes(geometry, properties=None, zooms=SHAPE_ZOOMS):
+    """为一个 GeoJSON 几何生成各缩放级别的 (zoom, 容差, 点数, TopoJSON 文本)"""
+    polygons = normalize_polygons(geometry)
+    shapes = []
+    for zoom in zooms:
+        tolerance = tolerance_for_zoom(zoom)
+        topology, point_count = to_topology(simplify_polygons(polygons, tolerance), tolerance, properties)
+        shapes.append((zoom, tolerance, point_count, topology))
+    return shapes
@@ -0,0 +1,28 @@
+"""
+Gunicorn 配置
+
+preload_app：在 master 里只创建一次应用，worker 通过 fork 共享已加载的模块（写时复制）。
+fork 前执行 gc.freeze()，把已有对象移出 GC 追踪，避免 worker 里的垃圾回收
+改写这些对象的头部而触发页面复制。
+"""
+
+import gc
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+preload_app = True
+# 后台导出 XLSX 要先写完临时文件才开始发送，默认 30 秒对大表不够用
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # master 若已建立过数据库连接，不能让多个 worker 共用同一个 socket
+    from database import db
+    app = server.app.wsgi()
+    with app.app_context():
+        db.engine.dispose(close=False)
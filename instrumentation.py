@@ -0,0 +1,331 @@
+"""
+请求级性能观测模块（可选开启）
+
+- before_request / after_request：记录每个请求耗时，并写入 Server-Timing 响应头
+- SQLAlchemy before/after_cursor_execute：按请求统计 SQL 次数与耗时，检测 N+1 查询
+- 采样分析：每 N 个请求对处理线程做栈采样，输出 flamegraph.pl 可直接使用的折叠栈
+- /metrics：以 Prometheus 文本格式暴露以上全部统计（所有 worker 合计）
+
+通过环境变量开启：
+    CHU_INSTRUMENTATION=1        开启请求与 SQL 统计、/metrics
+    CHU_PROFILE_EVERY=100        每 100 个请求采样一次（0 表示关闭）
+    CHU_PROFILE_INTERVAL_MS=5    采样间隔（毫秒）
+    CHU_N_PLUS_ONE_THRESHOLD=5   同一条 SQL 在一个请求内重复多少次视为 N+1
+    CHU_METRICS_ALLOW_IPS=127.0.0.1,::1   允许直接访问 /metrics 的来源地址
+    CHU_METRICS_TOKEN=...        其余来源需带 Authorization: Bearer <token>
+"""
+
+import hashlib
+import hmac
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Response, abort, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 请求耗时直方图的分桶（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class SharedCounters:
+    """跨 worker 共享的计数表：匿名共享内存中的开放寻址哈希表
+
+    与 ratelimit.SharedMemoryBackend 相同，需在 gunicorn master 中（preload_app）创建，
+    fork 出的 worker 共用同一份计数，/metrics 无论落到哪个 worker 都返回全局累计值。
+    每个槽位存 (key 哈希, 累计值, key 原文)；表满或 key 过长时丢弃该次观测。
+    """
+
+    SLOT = struct.Struct('Qd192s')
+    SEPARATOR = '\x1f'
+
+    def __init__(self, slots=4096):
+        self.slots = slots
+        self.buffer = mmap.mmap(-1, self.SLOT.size * slots)
+        self.lock = multiprocessing.Lock()
+
+    def _slot_for(self, key_bytes, key_hash):
+        """返回 key 所在（或可占用）槽位的偏移；表满时返回 None。调用方需持有锁"""
+        index = key_hash % self.slots
+        for _ in range(self.slots):
+            offset = index * self.SLOT.size
+            stored_hash, _, stored_key = self.SLOT.unpack_from(self.buffer, offset)
+            if stored_hash == 0 or (stored_hash == key_hash and stored_key.rstrip(b'\0') == key_bytes):
+                return offset
+            index = (index + 1) % self.slots
+        return None
+
+    def add_many(self, items):
+        """items: [(key 元组, 增量), ...]，在一次加锁内完成"""
+        with self.lock:
+            for key, amount in items:
+                key_bytes = self.SEPARATOR.join(key).encode('utf-8')
+                if len(key_bytes) > 192:
+                    continue
+                key_hash = int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), 'big') or 1
+                offset = self._slot_for(key_bytes, key_hash)
+                if offset is None:
+                    continue
+                _, value, _ = self.SLOT.unpack_from(self.buffer, offset)
+                self.SLOT.pack_into(self.buffer, offset, key_hash, value + amount, key_bytes)
+
+    def snapshot(self):
+        """返回 {key 元组: 累计值}"""
+        values = {}
+        with self.lock:
+            for offset in range(0, self.SLOT.size * self.slots, self.SLOT.size):
+                key_hash, value, key_bytes = self.SLOT.unpack_from(self.buffer, offset)
+                if key_hash:
+                    values[tuple(key_bytes.rstrip(b'\0').decode('utf-8').split(self.SEPARATOR))] = value
+        return values
+
+
+class Metrics:
+    """请求与 SQL 指标汇总，计数存放在 SharedCounters 中，所有 worker 合计"""
+
+    def __init__(self):
+        self.counters = SharedCounters()
+
+    def observe_request(self, endpoint, method, status, duration, query_count, query_time, n_plus_one):
+        items = [
+            (('requests', endpoint, method, str(status)), 1),
+            (('duration_sum', endpoint), duration),
+            (('duration_count', endpoint), 1),
+            (('db_queries', endpoint), query_count),
+            (('db_duration', endpoint), query_time),
+        ]
+        items.extend((('duration_bucket', endpoint, str(bound)), 1) for bound in DURATION_BUCKETS if duration <= bound)
+        if n_plus_one:
+            items.append((('n_plus_one', endpoint), 1))
+        self.counters.add_many(items)
+
+    def observe_profile(self, sample_count):
+        self.counters.add_many([(('profiled_requests',), 1), (('profile_samples',), sample_count)])
+
+    def render(self):
+        """输出 Prometheus 文本格式"""
+        values = self.counters.snapshot()
+        series = defaultdict(dict)  # 指标类别 -> {标签元组: 值}
+        for key, value in values.items():
+            series[key[0]][key[1:]] = value
+
+        lines = []
+        lines.append('# HELP chu_http_requests_total HTTP requests handled by all workers.')
+        lines.append('# TYPE chu_http_requests_total counter')
+        for (endpoint, method, status), value in sorted(series['requests'].items()):
+            lines.append(
+                f'chu_http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {int(value)}'
+            )
+
+        lines.append('# HELP chu_http_request_duration_seconds Request handling time.')
+        lines.append('# TYPE chu_http_request_duration_seconds histogram')
+        for (endpoint,), count in sorted(series['duration_count'].items()):
+            for bound in DURATION_BUCKETS:
+                lines.append(
+                    f'chu_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} '
+                    f'{int(series["duration_bucket"].get((endpoint, str(bound)), 0))}'
+                )
+            lines.append(f'chu_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {int(count)}')
+            lines.append(
+                f'chu_http_request_duration_seconds_sum{{endpoint="{endpoint}"}} '
+                f'{series["duration_sum"].get((endpoint,), 0.0):.6f}'
+            )
+            lines.append(f'chu_http_request_duration_seconds_count{{endpoint="{endpoint}"}} {int(count)}')
+
+        lines.append('# HELP chu_db_queries_total SQL statements executed, by endpoint.')
+        lines.append('# TYPE chu_db_queries_total counter')
+        for (endpoint,), value in sorted(series['db_queries'].items()):
+            lines.append(f'chu_db_queries_total{{endpoint="{endpoint}"}} {int(value)}')
+
+        lines.append('# HELP chu_db_query_duration_seconds_total Time spent in SQL, by endpoint.')
+        lines.append('# TYPE chu_db_query_duration_seconds_total counter')
+        for (endpoint,), value in sorted(series['db_duration'].items()):
+            lines.append(f'chu_db_query_duration_seconds_total{{endpoint="{endpoint}"}} {value:.6f}')
+
+        lines.append('# HELP chu_db_n_plus_one_requests_total Requests in which an N+1 query pattern was detected.')
+        lines.append('# TYPE chu_db_n_plus_one_requests_total counter')
+        for (endpoint,), value in sorted(series['n_plus_one'].items()):
+            lines.append(f'chu_db_n_plus_one_requests_total{{endpoint="{endpoint}"}} {int(value)}')
+
+        lines.append('# HELP chu_profiled_requests_total Requests captured by the sampling profiler.')
+        lines.append('# TYPE chu_profiled_requests_total counter')
+        lines.append(f'chu_profiled_requests_total {int(series["profiled_requests"].get((), 0))}')
+        lines.append('# HELP chu_profile_samples_total Stack samples captured by the sampling profiler.')
+        lines.append('# TYPE chu_profile_samples_total counter')
+        lines.append(f'chu_profile_samples_total {int(series["profile_samples"].get((), 0))}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+# ===== 1. 栈采样分析器 =====
+
+class StackSampler(threading.Thread):
+    """在后台线程中定时抓取目标线程的调用栈，结果为折叠栈计数"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def dump(self, path):
+        """追加写入折叠栈文件，可直接交给 flamegraph.pl 生成火焰图"""
+        with open(path, 'a', encoding='utf-8') as f:
+            for stack, count in self.stacks.items():
+                f.write(f'{stack} {count}\n')
+
+
+# ===== 2. SQLAlchemy 钩子 =====
+
+def _current_stats():
+    # 视图里常嵌套 app.app_context()，会产生新的 g；统计挂在 WSGI environ 上才能贯穿整个请求
+    if not has_request_context():
+        return None
+    return request.environ.get('chu.query_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    if stats is None:
+        return
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    stats['count'] += 1
+    stats['time'] += elapsed
+    stats['statements'][statement] += 1
+
+
+def _install_sql_hooks():
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+# ===== 3. 初始化函数 =====
+
+def init_instrumentation(app):
+    """按配置为 app 挂载请求统计、SQL 统计、采样分析与 /metrics"""
+    app.config.setdefault('INSTRUMENTATION_ENABLED', os.getenv('CHU_INSTRUMENTATION', '0') == '1')
+    app.config.setdefault('PROFILE_SAMPLE_EVERY', int(os.getenv('CHU_PROFILE_EVERY', '0')))
+    app.config.setdefault('PROFILE_INTERVAL_MS', float(os.getenv('CHU_PROFILE_INTERVAL_MS', '5')))
+    app.config.setdefault('N_PLUS_ONE_THRESHOLD', int(os.getenv('CHU_N_PLUS_ONE_THRESHOLD', '5')))
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config.setdefault('METRICS_ALLOW_IPS', [
+        ip.strip() for ip in os.getenv('CHU_METRICS_ALLOW_IPS', '127.0.0.1,::1').split(',') if ip.strip()
+    ])
+    app.config.setdefault('METRICS_TOKEN', os.getenv('CHU_METRICS_TOKEN'))
+
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+
+    _install_sql_hooks()
+    sample_every = app.config['PROFILE_SAMPLE_EVERY']
+    request_counter = {'n': 0}
+    counter_lock = threading.Lock()
+
+    @app.before_request
+    def _start_timer():
+        request.environ['chu.request_start'] = time.perf_counter()
+        request.environ['chu.query_stats'] = {'count': 0, 'time': 0.0, 'statements': Counter()}
+
+        if sample_every > 0:
+            with counter_lock:
+                request_counter['n'] += 1
+                should_sample = request_counter['n'] % sample_every == 0
+            if should_sample:
+                sampler = StackSampler(threading.get_ident(), app.config['PROFILE_INTERVAL_MS'] / 1000.0)
+                sampler.start()
+                request.environ['chu.stack_sampler'] = sampler
+
+    @app.after_request
+    def _record_timing(response):
+        start = request.environ.get('chu.request_start')
+        if start is None:
+            return response
+
+        duration = time.perf_counter() - start
+        stats = request.environ['chu.query_stats']
+        endpoint = request.endpoint or 'unknown'
+
+        # N+1：同一条参数化 SQL 在一个请求内被反复执行
+        repeated = [
+            (statement, count) for statement, count in stats['statements'].items()
+            if count >= app.config['N_PLUS_ONE_THRESHOLD']
+        ]
+        for statement, count in repeated:
+            app.logger.warning('疑似 N+1 查询 (%s 执行 %d 次): %s', endpoint, count, statement)
+
+        metrics.observe_request(
+            endpoint, request.method, response.status_code,
+            duration, stats['count'], stats['time'], bool(repeated)
+        )
+
+        sampler = request.environ.pop('chu.stack_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+            os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+            sampler.dump(os.path.join(app.config['PROFILE_DIR'], f'folded-{os.getpid()}.txt'))
+            metrics.observe_profile(sampler.samples)
+
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={stats["time"] * 1000:.2f};desc="{stats["count"]} queries", '
+            f'app;dur={duration * 1000:.2f}'
+        )
+        return response
+
+    @app.teardown_request
+    def _stop_sampler(exc):
+        # 请求异常中断时也要停止采样线程
+        sampler = request.environ.pop('chu.stack_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+
+    def metrics_allowed():
+        token = app.config['METRICS_TOKEN']
+        if token:
+            supplied = request.headers.get('Authorization', '')
+            if hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+                return True
+        return request.remote_addr in app.config['METRICS_ALLOW_IPS']
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        # 指标里含有路由与 SQL 耗时，只对本机或持有令牌的抓取端开放
+        if not metrics_allowed():
+            abort(403)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -7,8 +7,10 @@
 import sys
 import os
 import json
-from app import app, db
-from database import CenterPoint, ArchaeologicalSite, QuizQuestion
+from database import db, create_db_app, CenterPoint, ArchaeologicalSite, QuizQuestion, Territory, TerritoryShape
+
+# 只初始化数据库，不加载网站路由和后台
+app = create_db_app()
 
 def init_db():
     """初始化数据库"""
@@ -16,6 +18,10 @@ def init_db():
     with app.app_context():
         # 创建所有表
         db.create_all()
+        # create_all 不会给已存在的表补建索引，这里逐个检查补齐
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=db.engine, checkfirst=True)
         print("数据库表创建完成!")
 
 def migrate_data():
@@ -100,12 +106,104 @@ def migrate_data():
         else:
             print("未找到 quiz_questions.json，跳过题库迁移")
 
+    # 迁移疆域数据（可选）
+    territory_file = os.path.join(os.path.dirname(__file__), 'territories.geojson')
+    if os.path.exists(territory_file):
+        import_territories(territory_file)
+    else:
+        print("未找到 territories.geojson，跳过疆域迁移")
+
+    build_snapshot()
+
+def _territory_year_error(props):
+    """按 Territory 的约束检查年代，返回错误说明；合法时返回 None"""
+    from bulk import _range_checks
+
+    start_year, end_year = props['start_year'], props['end_year']
+    for key in ('start_year', 'end_year'):
+        if isinstance(props[key], bool) or not isinstance(props[key], int):
+            return f"{key} 必须为整数"
+    low, high, constraint_name = _range_checks(Territory)['start_year']
+    if not low <= start_year <= high:
+        return f"start_year 超出范围 [{low}, {high}]（{constraint_name}）"
+    if end_year < start_year:
+        return "end_year 不能早于 start_year"
+    return None
+
+
+def import_territories(path):
+    """从 GeoJSON 导入疆域，导入时为每个缩放级别预先简化、量化
+
+    每个 Feature 的 properties 需包含 name、start_year、end_year，可选 description；
+    名称与年代相同的旧记录会被替换；缺少属性、年代不合法或几何无效的 Feature 逐条报告后跳过。
+    """
+    from geometry import build_shapes
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            collection = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"错误: 读取疆域文件失败 {e}")
+        return
+
+    with app.app_context():
+        imported = 0
+        for index, feature in enumerate(collection.get('features', []), 1):
+            props = feature.get('properties') or {}
+            missing = [key for key in ('name', 'start_year', 'end_year') if props.get(key) is None]
+            if missing:
+                print(f"跳过第 {index} 个疆域: 缺少属性 {', '.join(missing)}")
+                continue
+            year_error = _territory_year_error(props)
+            if year_error:
+                print(f"跳过第 {index} 个疆域 {props['name']}: {year_error}")
+                continue
+
+            shape_props = {'name': props['name'], 'start_year': props['start_year'], 'end_year': props['end_year']}
+            try:
+                shapes = build_shapes(feature['geometry'], shape_props)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"跳过第 {index} 个疆域 {props['name']}: 几何数据无效 {e}")
+                continue
+
+            territory = Territory.query.filter_by(
+                name=props['name'], start_year=props['start_year'], end_year=props['end_year']
+            ).first()
+            if territory is None:
+                territory = Territory(name=props['name'], start_year=props['start_year'], end_year=props['end_year'])
+                db.session.add(territory)
+            elif territory.shapes:
+                # 先删除旧的各级几何，否则同一 zoom 的新行会违反 uq_territory_zoom
+                territory.shapes.clear()
+                db.session.flush()
+            territory.description = props.get('description', '')
+
+            territory.shapes = [
+                TerritoryShape(zoom=zoom, tolerance=tolerance, point_count=point_count, topology=topology)
+                for zoom, tolerance, point_count, topology in shapes
+            ]
+            imported += 1
+            counts = ', '.join(f'z{s.zoom}:{s.point_count}' for s in territory.shapes)
+            print(f"已导入疆域: {territory.name} ({territory.start_year} ~ {territory.end_year}) 点数 {counts}")
+
+        db.session.commit()
+        print(f"疆域导入完成: {imported} 个")
+
+def build_snapshot():
+    """重新生成地图数据静态快照"""
+    from snapshot import write_map_snapshot
+    with app.app_context():
+        filename = write_map_snapshot()
+        print(f"地图快照已生成: static/data/{filename}")
+
 def main():
     if len(sys.argv) < 2:
         print("用法:")
         print("  python migrate.py init     # 初始化数据库")
         print("  python migrate.py migrate  # 迁移数据")
         print("  python migrate.py all      # 初始化数据库并迁移数据")
+        print("  python migrate.py snapshot # 重新生成地图数据快照")
+        print("  python migrate.py territory <file.geojson>  # 导入疆域多边形")
         return
 
     command = sys.argv[1]
@@ -117,9 +215,13 @@ def main():
     elif command == 'all':
         init_db()
         migrate_data()
+    elif command == 'snapshot':
+        build_snapshot()
+    elif command == 'territory' and len(sys.argv) > 2:
+        import_territories(sys.argv[2])
     else:
         print(f"未知命令: {command}")
-        print("可用命令: init, migrate, all")
+        print("可用命令: init, migrate, all, snapshot, territory")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""
+按客户端限流模块（令牌桶）
+
+每个 (客户端 IP, 路由) 一个令牌桶：容量为时间窗口内允许的请求数，令牌按固定速率补充。
+超出预算的请求返回 429 并带 Retry-After 头。只对 RATE_LIMITS 中配置的路由生效，
+地图浏览等其余路由不受影响。
+
+计数存储：
+    SharedMemoryBackend  默认。gunicorn --preload 时在 master 中创建匿名共享内存，
+                         所有 worker 共用同一份计数
+    RedisBackend         设置 CHU_RATELIMIT_REDIS_URL 后启用；也可传入任何实现了
+                         eval() 的 Redis 兼容客户端（如本地测试用的 stand-in）
+
+环境变量：
+    CHU_RATELIMIT_ENABLED=0      关闭限流
+    CHU_RATE_LIMITS="main.get_quiz_questions=300/minute;main.download_file=20/minute"
+    CHU_RATELIMIT_REDIS_URL=redis://localhost:6379/0
+    CHU_RATELIMIT_TRUST_PROXY=1  位于 Nginx 之后时，从 X-Forwarded-For 取客户端 IP
+"""
+
+import hashlib
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+import threading
+import time
+
+# 默认预算：随机抽题会对数据库做 ORDER BY random()，下载会占用 worker 发送文件
+DEFAULT_RATE_LIMITS = {
+    # 互动挑战每局都从这里抽题；课堂上全班共用一个出口 IP，预算按一个班同时开局来定
+    'main.get_quiz_questions': '300/minute',
+    'main.download_file': '20/minute',
+    # 每局 5 次作答上报，与抽题预算对应；上报只写内存缓冲，开销很小
+    'main.ingest_quiz_answers': '1500/minute',
+}
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(spec):
+    """'30/minute' -> (容量 30, 每秒补充 0.5 个令牌)"""
+    count, _, period = spec.partition('/')
+    count = int(count)
+    seconds = PERIODS[period.strip() or 'second']
+    return count, count / seconds
+
+
+def parse_limits(text):
+    """'a=30/minute;b=5/second' -> {'a': '30/minute', 'b': '5/second'}"""
+    limits = {}
+    for item in text.split(';'):
+        if '=' in item:
+            endpoint, spec = item.split('=', 1)
+            limits[endpoint.strip()] = spec.strip()
+    return limits
+
+
+def _refill(tokens, last, capacity, rate, now):
+    return min(capacity, tokens + max(0.0, now - last) * rate)
+
+
+# ===== 1. 计数存储 =====
+
+class SharedMemoryBackend:
+    """固定槽位的共享内存哈希表，每个槽位存 (key 哈希, 剩余令牌, 上次更新时间)
+
+    槽位冲突时新 key 直接接管该槽位（相当于给它一个满桶），只会让限流偏宽松，不会误伤。
+    """
+
+    SLOT = struct.Struct('Qdd')
+
+    def __init__(self, slots=8192):
+        self.slots = slots
+        # 匿名 mmap 在 fork 后由父子进程共享；锁同样需在 fork 前创建
+        self.buffer = mmap.mmap(-1, self.SLOT.size * slots)
+        self.lock = multiprocessing.Lock()
+
+    def consume(self, key, capacity, rate):
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big') or 1
+        offset = (key_hash % self.slots) * self.SLOT.size
+        now = time.monotonic()
+        with self.lock:
+            stored_hash, tokens, last = self.SLOT.unpack_from(self.buffer, offset)
+            if stored_hash != key_hash:
+                tokens, last = float(capacity), now
+            tokens = _refill(tokens, last, capacity, rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.SLOT.pack_into(self.buffer, offset, key_hash, tokens, now)
+        return allowed, tokens
+
+
+class RedisBackend:
+    """令牌桶放在 Redis 中，用 Lua 脚本保证读改写原子性"""
+
+    SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+    def __init__(self, client, prefix='chu:ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        import redis
+        return cls(redis.Redis.from_url(url))
+
+    def consume(self, key, capacity, rate):
+        allowed, tokens = self.client.eval(self.SCRIPT, 1, self.prefix + key, capacity, rate, time.time())
+        return bool(int(allowed)), float(tokens)
+
+
+# ===== 2. 限流器 =====
+
+class RateLimiter:
+    def __init__(self, backend, limits):
+        self.backend = backend
+        self.limits = {endpoint: parse_limit(spec) for endpoint, spec in limits.items()}
+
+    def hit(self, endpoint, client_id):
+        """消耗一个令牌；返回 (是否放行, 需等待的秒数)。未配置的路由总是放行"""
+        limit = self.limits.get(endpoint)
+        if limit is None:
+            return True, 0
+        capacity, rate = limit
+        try:
+            allowed, tokens = self.backend.consume(f'{endpoint}:{client_id}', capacity, rate)
+        except Exception as e:
+            # 存储不可用时放行，避免限流组件拖垮整个站点
+            print(f"限流存储访问失败: {e}")
+            return True, 0
+        if allowed:
+            return True, 0
+        return False, max(1, math.ceil((1 - tokens) / rate))
+
+
+class LocalRateLimiter(RateLimiter):
+    """单进程使用的限流器（如 Streamlit 问答助手），计数放在进程内存中"""
+
+    def __init__(self, limits):
+        super().__init__(_LocalBackend(), limits)
+
+
+class _LocalBackend:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def consume(self, key, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(key, (float(capacity), now))
+            tokens = _refill(tokens, last, capacity, rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+        return allowed, tokens
+
+
+# ===== 3. 初始化函数 =====
+
+def init_rate_limit(app, backend=None):
+    """为 app 挂载限流；backend 为空时按配置选择 Redis 或共享内存"""
+    from flask import jsonify, request
+
+    app.config.setdefault('RATELIMIT_ENABLED', os.getenv('CHU_RATELIMIT_ENABLED', '1') == '1')
+    app.config.setdefault('RATE_LIMITS', {**DEFAULT_RATE_LIMITS, **parse_limits(os.getenv('CHU_RATE_LIMITS', ''))})
+    app.config.setdefault('RATELIMIT_REDIS_URL', os.getenv('CHU_RATELIMIT_REDIS_URL'))
+    app.config.setdefault('RATELIMIT_TRUST_PROXY', os.getenv('CHU_RATELIMIT_TRUST_PROXY', '0') == '1')
+
+    if not app.config['RATELIMIT_ENABLED']:
+        return None
+
+    if not app.config['RATELIMIT_TRUST_PROXY'] and os.getenv('GUNICORN_BIND', '').startswith('unix:'):
+        # 经 unix socket 接收 Nginx 转发时 remote_addr 为空，所有访客会共用同一个令牌桶
+        app.logger.warning('限流已开启但未设置 CHU_RATELIMIT_TRUST_PROXY=1，'
+                           'unix socket 之后无法区分客户端，所有请求将共用同一份预算')
+
+    if backend is None:
+        if app.config['RATELIMIT_REDIS_URL']:
+            backend = RedisBackend.from_url(app.config['RATELIMIT_REDIS_URL'])
+        else:
+            backend = SharedMemoryBackend()
+    limiter = RateLimiter(backend, app.config['RATE_LIMITS'])
+    app.extensions['rate_limiter'] = limiter
+
+    def client_id():
+        if app.config['RATELIMIT_TRUST_PROXY'] and request.access_route:
+            # Nginx 把真实来源追加在 X-Forwarded-For 末尾，前面的部分可由客户端伪造
+            return request.access_route[-1]
+        return request.remote_addr or 'unknown'
+
+    @app.before_request
+    def _check_rate_limit():
+        if request.endpoint not in limiter.limits:
+            return None
+        allowed, retry_after = limiter.hit(request.endpoint, client_id())
+        if allowed:
+            return None
+        response = jsonify({"error": "Too many requests", "retry_after": retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    return limiter
@@ -0,0 +1,201 @@
+"""
+地图数据快照模块
+
+把地图页需要的全部数据（中心点、遗址列表、时期划分）渲染成一个带内容哈希的静态文件：
+    static/data/map-<hash>.json
+    static/data/map-<hash>.json.gz   （供 Nginx gzip_static 直接发送）
+    static/data/map-manifest.json    （记录当前版本的文件名）
+    static/data/map.html             （已填入当前快照地址的地图页，Nginx 可直接发送）
+
+文件名随内容变化，Nginx 可以对其设置 immutable 长缓存；遗址或中心点提交修改后自动重建，
+migrate.py 迁移数据后也会重建一次。
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+from flask import url_for
+from jinja2 import Environment, FileSystemLoader
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db, CenterPoint, ArchaeologicalSite
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.path.join(BASE_DIR, 'static', 'data')
+MANIFEST_NAME = 'map-manifest.json'
+MAP_PAGE_NAME = 'map.html'
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
+
+# 保留最近几个版本，已打开旧页面的用户仍能取到对应文件
+KEEP_VERSIONS = 5
+
+# 时间轴时期划分：年份 <= end 即属于该时期（end 为 None 表示其后全部）
+PERIODS = [
+    {'name': '战国早期', 'end': -403},
+    {'name': '战国中期', 'end': -323},
+    {'name': '战国晚期', 'end': None},
+]
+
+# 影响地图快照的模型
+SNAPSHOT_MODELS = (CenterPoint, ArchaeologicalSite)
+
+
+def build_map_bundle(session):
+    """从数据库组装完整的地图数据（结构与 /api/sites 一致，另附时期划分）"""
+    center_point = session.query(CenterPoint).first()
+    sites = session.query(ArchaeologicalSite).order_by(ArchaeologicalSite.id).all()
+    return {
+        'center_point': center_point.to_dict() if center_point else {},
+        'sites': [site.to_dict() for site in sites],
+        'periods': PERIODS,
+    }
+
+
+def _atomic_write(path, data):
+    # 临时文件名各不相同：多个 worker 同时重建时不会互相截断对方的临时文件
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_map_snapshot(session=None, output_dir=SNAPSHOT_DIR):
+    """生成快照文件并更新 manifest，返回新文件名"""
+    bundle = build_map_bundle(session or db.session)
+    payload = json.dumps(bundle, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(payload).hexdigest()[:12]
+    filename = f'map-{digest}.json'
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, filename)
+    if not os.path.exists(path):
+        _atomic_write(path, payload)
+        # mtime=0 保证同样的内容得到同样的 gzip 字节
+        _atomic_write(f'{path}.gz', gzip.compress(payload, compresslevel=9, mtime=0))
+
+    manifest = {'map': filename, 'versions': [filename]}
+    old_manifest = read_manifest(output_dir)
+    for old in old_manifest.get('versions', []):
+        if old != filename and len(manifest['versions']) < KEEP_VERSIONS:
+            manifest['versions'].append(old)
+    _atomic_write(
+        os.path.join(output_dir, MANIFEST_NAME),
+        json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+    )
+    _prune(output_dir, manifest['versions'])
+    render_map_page(filename, output_dir)
+    return filename
+
+
+def render_map_page(filename, output_dir=SNAPSHOT_DIR):
+    """把地图页渲染成静态文件，数据地址直接指向该版本快照
+
+    使用独立的 jinja2 环境渲染，migrate.py 等没有完整 web 应用的场景也能调用。
+    """
+    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True)
+    env.globals['map_snapshot_url'] = lambda: f'/static/data/{filename}'
+    html = env.get_template(MAP_PAGE_NAME).render()
+    _atomic_write(os.path.join(output_dir, MAP_PAGE_NAME), html.encode('utf-8'))
+
+
+def _prune(output_dir, keep):
+    """删除不在 manifest 中的旧版本"""
+    keep_files = set(keep) | {f'{name}.gz' for name in keep}
+    for name in os.listdir(output_dir):
+        if name.startswith('map-') and name != MANIFEST_NAME and name not in keep_files:
+            try:
+                os.remove(os.path.join(output_dir, name))
+            except OSError:
+                pass
+
+
+def read_manifest(output_dir=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# 各 worker 按 manifest 的 mtime 缓存，其他 worker 重建后也能及时看到新版本
+_manifest_cache = {'mtime': None, 'map': None}
+
+
+def current_map_snapshot():
+    """返回当前快照文件名；尚未生成时返回 None"""
+    path = os.path.join(SNAPSHOT_DIR, MANIFEST_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    if mtime != _manifest_cache['mtime']:
+        _manifest_cache['map'] = read_manifest().get('map')
+        _manifest_cache['mtime'] = mtime
+    return _manifest_cache['map']
+
+
+def map_snapshot_url():
+    """模板中使用的快照地址；没有快照时回退到 /api/sites"""
+    filename = current_map_snapshot()
+    if filename is None:
+        return url_for('main.get_map_data')
+    return url_for('static', filename=f'data/{filename}')
+
+
+# ===== 提交后自动重建 =====
+
+def mark_map_dirty(session):
+    """标记本次事务修改了地图数据（批量写入等不经过 ORM 对象的操作需手动调用）"""
+    session.info['map_snapshot_dirty'] = True
+
+
+def _after_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SNAPSHOT_MODELS):
+            mark_map_dirty(session)
+            return
+
+
+def _after_commit(session):
+    if not session.info.pop('map_snapshot_dirty', False):
+        return
+    try:
+        # after_commit 中原 session 不能再执行 SQL，用独立 session 读取
+        with Session(bind=db.engine) as read_session:
+            write_map_snapshot(read_session)
+    except Exception as e:
+        print(f"地图快照重建失败: {e}")
+
+
+def _after_rollback(session):
+    session.info.pop('map_snapshot_dirty', None)
+
+
+def init_snapshot(app):
+    """注册提交钩子与模板变量"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+
+    app.jinja_env.globals['map_snapshot_url'] = map_snapshot_url
+
+    # 部署后模板或静态资源可能已变化，启动时按当前快照重新渲染一次静态地图页
+    filename = current_map_snapshot()
+    if filename is not None:
+        try:
+            render_map_page(filename)
+        except Exception as e:
+            print(f"静态地图页渲染失败: {e}")
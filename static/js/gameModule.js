@@ -1,9 +1,12 @@
 /**
  * 楚韵 - 文字挑战逻辑库
- * 数据源：quiz_questions.json
+ * 数据源：每局从 /api/quiz-questions 抽题（带题目 id，作答可上报统计）；
+ *        接口不可用时回退到 quiz_questions.json 本地抽题
  */
 
+const ROUND_URL = '/api/quiz-questions';
 const DATA_URL = '/quiz_questions.json';
+const ANSWER_URL = '/api/quiz-answers';
 
 const game = {
     fullLibrary: [],      // 存放从 JSON 读取的完整题库
@@ -11,6 +14,7 @@ const game = {
     currentIdx: 0,
     score: 0,
     isAnswering: false,
+    questionShownAt: 0,
 
     // 初始化：自动从 JSON 文件加载数据
     init: async function() {
@@ -58,18 +62,32 @@ const game = {
     },
 
     // 1. 开始游戏
-    start: function() {
-        // 检查数据是否已加载
-        if (!this.fullLibrary || this.fullLibrary.length === 0) {
-            alert("题库数据正在加载或加载失败，请刷新页面重试！");
-            // 尝试重新加载
-            this.init();
-            return;
+    start: async function() {
+        try {
+            // 优先由服务端抽题：题目带数据库 id，作答记录才能入库统计
+            const response = await fetch(ROUND_URL);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            this.currentQuestions = await response.json();
+        } catch (e) {
+            console.warn("在线抽题失败，改用本地题库:", e);
+            this.currentQuestions = [];
         }
 
-        // 随机打乱完整题库，取前5个
-        const shuffled = [...this.fullLibrary].sort(() => 0.5 - Math.random());
-        this.currentQuestions = shuffled.slice(0, 5);
+        if (this.currentQuestions.length < 5) {
+            // 检查数据是否已加载
+            if (!this.fullLibrary || this.fullLibrary.length === 0) {
+                alert("题库数据正在加载或加载失败，请刷新页面重试！");
+                // 尝试重新加载
+                this.init();
+                return;
+            }
+
+            // 随机打乱完整题库，取前5个
+            const shuffled = [...this.fullLibrary].sort(() => 0.5 - Math.random());
+            this.currentQuestions = shuffled.slice(0, 5);
+        }
 
         this.currentIdx = 0;
         this.score = 0;
@@ -99,6 +117,7 @@ const game = {
         // 设置题目
         ui.questionVisual.innerText = data.visual;
         ui.questionText.innerText = data.question;
+        this.questionShownAt = performance.now();
 
         // 生成选项
         data.options.forEach((opt, index) => {
@@ -120,6 +139,8 @@ const game = {
         const ui = this.getUI();
         const buttons = ui.optionsContainer.children;
 
+        this.reportAnswer(data, selectedIndex);
+
         // 样式反馈
         if (isCorrect) {
             btnElement.classList.add('correct');
@@ -138,6 +159,17 @@ const game = {
         ui.nextBtn.innerText = (this.currentIdx === 4) ? "查看结果" : "下一题";
     },
 
+    // 上报作答记录（本地题库回退时题目没有 id，不上报）；sendBeacon 不阻塞页面，失败也不影响答题
+    reportAnswer: function(data, selectedIndex) {
+        if (data.id === undefined || !navigator.sendBeacon) return;
+        const event = {
+            question_id: data.id,
+            selected: selectedIndex,
+            elapsed_ms: Math.round(performance.now() - this.questionShownAt)
+        };
+        navigator.sendBeacon(ANSWER_URL, new Blob([JSON.stringify(event)], { type: 'application/json' }));
+    },
+
     // 4. 下一题
     next: function() {
         if (this.currentIdx < 4) {
@@ -2,6 +2,35 @@
 
 const API_BASE_URL = '/api';
 
+// 默认时期划分（快照中带有 periods 时以快照为准）
+const DEFAULT_PERIODS = [
+    { name: "战国早期", end: -403 },
+    { name: "战国中期", end: -323 },
+    { name: "战国晚期", end: null }
+];
+
+// 把接口返回的 TopoJSON（每个环一条差分编码的 arc）还原为 GeoJSON MultiPolygon
+function decodeTerritory(topo) {
+    const [sx, sy] = topo.transform.scale;
+    const [tx, ty] = topo.transform.translate;
+    const arcs = topo.arcs.map(arc => {
+        let x = 0, y = 0;
+        return arc.map(([dx, dy]) => {
+            x += dx; y += dy;
+            return [x * sx + tx, y * sy + ty];
+        });
+    });
+    const object = topo.objects.territory;
+    return {
+        type: 'Feature',
+        properties: object.properties,
+        geometry: {
+            type: 'MultiPolygon',
+            coordinates: object.arcs.map(polygon => polygon.map(([i]) => arcs[i]))
+        }
+    };
+}
+
 export async function initMap() {
     const slider = document.getElementById('timeSlider');
     const yearText = document.getElementById('yearText');
@@ -30,13 +59,15 @@ export async function initMap() {
     let mapLayers = [];
 
     try {
-        // 获取后端数据
-        const response = await fetch(`${API_BASE_URL}/sites`);
+        // 优先读取带内容哈希的静态快照，未生成快照时回退到接口
+        const bundleUrl = document.getElementById('chuMap').dataset.bundle || `${API_BASE_URL}/sites`;
+        const response = await fetch(bundleUrl);
         const data = await response.json();
 
         // 确保数据结构正确
         const centerData = data.center_point || { lat: 30.3, lng: 112.2, name: "郢都" };
         const sitesData = data.sites || [];
+        const periods = data.periods || DEFAULT_PERIODS;
 
         // --- 2. 绘制中心点 (如：纪南城) ---
         const centerIcon = L.divIcon({
@@ -105,10 +136,7 @@ export async function initMap() {
             const absYear = Math.abs(currentYear);
 
             // 根据年份显示不同时期名称
-            let period = "";
-            if (currentYear <= -403) period = "战国早期";
-            else if (currentYear <= -323) period = "战国中期";
-            else period = "战国晚期";
+            const period = periods.find(p => p.end === null || currentYear <= p.end).name;
 
             yearText.innerText = `${period} (前${absYear})`;
 
@@ -123,8 +151,48 @@ export async function initMap() {
             });
         }
 
-        slider.addEventListener('input', updateMap);
+        // --- 5. 疆域图层：按年份与缩放级别加载预简化的边界 ---
+        let territoryLayer = null;
+        let territoryInfo = null;   // 当前图层覆盖的 { start_year, end_year, zoom }
+        let territoryTimer = null;
+
+        async function updateTerritory() {
+            const year = parseInt(slider.value);
+            const zoom = map.getZoom();
+            if (territoryInfo && territoryInfo.zoom === zoom &&
+                year >= territoryInfo.start_year && year <= territoryInfo.end_year) {
+                return; // 同一年代区间、同一缩放级别，无需重新请求
+            }
+            try {
+                const res = await fetch(`${API_BASE_URL}/territory?year=${year}&zoom=${zoom}`);
+                if (!res.ok) {
+                    if (territoryLayer) map.removeLayer(territoryLayer);
+                    territoryLayer = null;
+                    territoryInfo = null;
+                    return;
+                }
+                const feature = decodeTerritory(await res.json());
+                if (territoryLayer) map.removeLayer(territoryLayer);
+                territoryLayer = L.geoJSON(feature, {
+                    interactive: false,
+                    style: { color: '#B83B28', weight: 1.5, fillColor: '#B83B28', fillOpacity: 0.12 }
+                }).addTo(map);
+                territoryInfo = { ...feature.properties, zoom };
+            } catch (e) {
+                console.warn("疆域数据加载失败", e);
+            }
+        }
+
+        // 拖动时间轴时合并请求
+        function scheduleTerritory() {
+            clearTimeout(territoryTimer);
+            territoryTimer = setTimeout(updateTerritory, 120);
+        }
+
+        slider.addEventListener('input', () => { updateMap(); scheduleTerritory(); });
+        map.on('zoomend', scheduleTerritory);
         updateMap(); // 初始化一次
+        updateTerritory();
 
     } catch (error) {
         console.error("地图数据加载失败", error);